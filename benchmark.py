@@ -0,0 +1,237 @@
+import logging
+import os
+import sys
+import argparse
+import random
+import tempfile
+import time
+import platform
+from datetime import datetime
+import json_codec
+import compressed_io
+from interval_index import IntervalDict
+from ftm_mapper import read_entities, transform, load_mapping, THING_ENTITY_LIST, INTERVALS_ENTITY_LIST
+from senzing_utils import load_lines
+
+try:
+    import resource # not available on Windows
+except ImportError:
+    resource = None
+
+COUNTRIES = ["ru", "ua", "by", "kz", "de", "gb", "us", "cy", "lv", "ae"]
+FIRST_NAMES = ["Ivan", "Petr", "Anna", "Olga", "Sergey", "Maria", "Alexey", "Elena", "Dmitry", "Natalia"]
+LAST_NAMES = ["Ivanov", "Petrov", "Sidorov", "Smirnov", "Kuznetsov", "Popov", "Volkov", "Sokolov", "Lebedev", "Kozlov"]
+COMPANY_WORDS = ["Trade", "Invest", "Group", "Holding", "Energy", "Capital", "Logistic", "Develop", "Stroy", "Neft"]
+COMPANY_SCHEMATA = ["Company", "Company", "Company", "Organization", "LegalEntity", "PublicBody"]
+# (schema, person prop, company prop, share in generated intervals)
+PERSON_COMPANY_INTERVALS = [("Directorship", "director", "organization", 4), ("Ownership", "owner", "asset", 3), ("Employment", "employee", "employer", 1),
+                            ("Membership", "member", "organization", 1), ("Representation", "agent", "client", 1), ("UnknownLink", "subject", "object", 1)]
+PERSON_PERSON_INTERVALS = [("Family", "person", "relative", 1), ("Associate", "person", "associate", 1)]
+
+# seeded generator of synthetic FtM entities: persons and companies with addresses (shared between entities), identifications,
+# person-company and person-person intervals, hub companies with thousands of directorships and some entities of unknown schemata
+def generate_entities(entities = 10000, seed = 1, company_ratio = 0.4, interval_density = 2.0, hubs = 2, hub_size = 2000, address_reuse = 0.5):
+    rnd = random.Random(seed)
+    companies = max(1, int(entities * company_ratio))
+    persons = max(1, entities - companies)
+    addresses = max(1, int(entities * (1 - address_reuse)))
+
+    for i in range(addresses):
+        city = "City %d" % rnd.randrange(100)
+        yield {"id": "addr-%d" % i, "schema": "Address", "properties": {
+            "full": ["%d Main street, %s" % (i, city)], "street": ["%d Main street" % i], "city": [city],
+            "postalCode": ["%06d" % rnd.randrange(10**6)], "country": [rnd.choice(COUNTRIES)]}}
+
+    for i in range(persons):
+        properties = {
+            "name": ["%s %s" % (rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES))],
+            "birthDate": ["%d-%02d-%02d" % (rnd.randint(1940, 2000), rnd.randint(1, 12), rnd.randint(1, 28))],
+            "gender": [rnd.choice(["male", "female"])],
+            "nationality": [rnd.choice(COUNTRIES)],
+            "addressEntity": ["addr-%d" % rnd.randrange(addresses)]}
+        if rnd.random() < 0.3:
+            properties["alias"] = ["%s %s" % (rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES))]
+        if rnd.random() < 0.3:
+            properties["email"] = ["person%d@example.com" % i]
+        if rnd.random() < 0.5:
+            properties["innCode"] = ["%012d" % rnd.randrange(10**12)]
+        yield {"id": "person-%d" % i, "schema": "Person", "properties": properties}
+        if rnd.random() < 0.2:
+            yield {"id": "id-%d" % i, "schema": "Identification", "properties": {
+                "holder": ["person-%d" % i], "number": ["%010d" % rnd.randrange(10**10)], "country": [rnd.choice(COUNTRIES)]}}
+
+    for i in range(companies):
+        properties = {
+            "name": ["%s %s %d" % (rnd.choice(COMPANY_WORDS), rnd.choice(COMPANY_WORDS), i)],
+            "jurisdiction": [rnd.choice(COUNTRIES)],
+            "incorporationDate": ["%d-%02d-%02d" % (rnd.randint(1990, 2022), rnd.randint(1, 12), rnd.randint(1, 28))],
+            "addressEntity": ["addr-%d" % rnd.randrange(addresses)],
+            "innCode": ["%010d" % rnd.randrange(10**10)]}
+        if rnd.random() < 0.5:
+            properties["ogrnCode"] = ["%013d" % rnd.randrange(10**13)]
+        yield {"id": "company-%d" % i, "schema": rnd.choice(COMPANY_SCHEMATA), "properties": properties}
+
+    weights = [interval[3] for interval in PERSON_COMPANY_INTERVALS + PERSON_PERSON_INTERVALS]
+    for i in range(int(persons * interval_density)):
+        schema, person_prop, other_prop, _ = rnd.choices(PERSON_COMPANY_INTERVALS + PERSON_PERSON_INTERVALS, weights)[0]
+        other = "company-%d" % rnd.randrange(companies) if other_prop not in ("relative", "associate") else "person-%d" % rnd.randrange(persons)
+        yield {"id": "link-%d" % i, "schema": schema, "properties": {
+            person_prop: ["person-%d" % rnd.randrange(persons)], other_prop: [other], "role": [schema.lower()]}}
+
+    # hub companies (e.g. mass registration addresses or state bodies) with a lot of directors
+    for hub in range(min(hubs, companies)):
+        for i in range(hub_size):
+            yield {"id": "hub-%d-%d" % (hub, i), "schema": "Directorship", "properties": {
+                "director": ["person-%d" % rnd.randrange(persons)], "organization": ["company-%d" % hub], "role": ["director"]}}
+
+    for i in range(entities // 20):
+        yield {"id": "other-%d" % i, "schema": rnd.choice(["Sanction", "Payment", "Note"]), "properties": {}}
+
+def generate_corpus(corpus_file, log, **params):
+    count = 0
+    with compressed_io.open_text(corpus_file, "w") as fh:
+        for entity in generate_entities(**params):
+            fh.write(json_codec.dumps(entity))
+            fh.write("\n")
+            count += 1
+    log.info('Generated %d FtM entities: %s' % (count, corpus_file))
+    return count
+
+# senzing engine stub which accepts every record, measures loader overhead (parsing, thread pool) without Senzing
+class NullEngine:
+
+    def addRecord(self, dataSourceCode, recordId, jsonData, loadId = None):
+        pass
+
+    def getActiveConfigID(self, response):
+        response += b'1'
+
+    def getDefaultConfigID(self, response):
+        response += b'1'
+
+def peak_rss_mb():
+    if not resource:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10 # bytes on macOS, KB on Linux
+
+# run mapper stages and loader submission on corpus file, returns metrics
+def run_benchmark(corpus_file, data_source, log, num_of_threads = 4):
+    load_mapping()
+    intervals_dicts = [IntervalDict() for _ in range(10)]
+    RELATIONSHIPS = IntervalDict()
+    transform_dicts = (RELATIONSHIPS, intervals_dicts[6], intervals_dicts[7]) # with IDENTIFICATIONS and ADDRESSES
+    stage_seconds = {"read_entities": 0.0, "transform": 0.0, "serialization": 0.0, "loader_submission": 0.0}
+    records = 0
+    output = tempfile.NamedTemporaryFile(mode='w+t', encoding='utf-8', delete=False)
+    try:
+        # mapper stages are timed separately on the same stream (read_entities includes index phase)
+        entities = read_entities(corpus_file, THING_ENTITY_LIST, INTERVALS_ENTITY_LIST, *intervals_dicts, log, data_source = data_source, RELATIONSHIPS = RELATIONSHIPS)
+        while True:
+            started = time.perf_counter()
+            entity = next(entities, None)
+            stage_seconds["read_entities"] += time.perf_counter() - started
+            if entity is None:
+                break
+            started = time.perf_counter()
+            record = transform(data_source, entity, *transform_dicts)
+            stage_seconds["transform"] += time.perf_counter() - started
+            started = time.perf_counter()
+            line = json_codec.dumps_record(record)
+            stage_seconds["serialization"] += time.perf_counter() - started
+            output.write(line)
+            output.write("\n")
+            records += 1
+        output.seek(0)
+        started = time.perf_counter()
+        loaded = load_lines(output, NullEngine(), NullEngine(), log, num_of_threads)
+        stage_seconds["loader_submission"] = time.perf_counter() - started
+    finally:
+        output.close()
+        os.remove(output.name)
+    mapper_seconds = stage_seconds["read_entities"] + stage_seconds["transform"] + stage_seconds["serialization"]
+    return {
+        "records": records,
+        "mapper_records_per_sec": records / mapper_seconds if mapper_seconds else None,
+        "loader_records_per_sec": loaded / stage_seconds["loader_submission"] if stage_seconds["loader_submission"] else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "stage_seconds": stage_seconds}
+
+# previous result with the same corpus params, for comparison between versions
+def previous_result(results_file, params):
+    if not os.path.exists(results_file):
+        return None
+    previous = None
+    with open(results_file, "r", encoding="utf-8") as fh:
+        for line in fh:
+            result = json_codec.loads(line)
+            if result["params"] == params:
+                previous = result
+    return previous
+
+def log_comparison(metrics, previous, log):
+    def compare(name, value, old_value):
+        if value is None or not old_value:
+            log.info(' %s: %s' % (name, value))
+        else:
+            log.info(' %s: %.3f (was %.3f, %+.1f%%)' % (name, value, old_value, (value - old_value) * 100 / old_value))
+    old_metrics = previous["metrics"] if previous else {}
+    if previous:
+        log.info('Compared with "%s" (%s):' % (previous["name"], previous["time"]))
+    for name in ("mapper_records_per_sec", "loader_records_per_sec", "peak_rss_mb"):
+        compare(name, metrics[name], old_metrics.get(name))
+    for name, value in metrics["stage_seconds"].items():
+        compare(name + '_seconds', value, old_metrics.get("stage_seconds", {}).get(name))
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('-c', '--corpus_file', default=os.getenv('corpus_file', None), type=str, help='optional FtM .json corpus file, generated with params below if not exists (default: temp file, removed after benchmark).')
+    argparser.add_argument('-n', '--entities', default=os.getenv('entities', 10000), type=int, help='number of generated persons and companies (default: 10000).')
+    argparser.add_argument('-sd', '--seed', default=os.getenv('seed', 1), type=int, help='random seed of generator (default: 1).')
+    argparser.add_argument('-cr', '--company_ratio', default=os.getenv('company_ratio', 0.4), type=float, help='share of companies among generated things (default: 0.4).')
+    argparser.add_argument('-id', '--interval_density', default=os.getenv('interval_density', 2.0), type=float, help='intervals (Directorship, Ownership and so on) per person (default: 2.0).')
+    argparser.add_argument('-hb', '--hubs', default=os.getenv('hubs', 2), type=int, help='number of hub companies (default: 2).')
+    argparser.add_argument('-hs', '--hub_size', default=os.getenv('hub_size', 2000), type=int, help='directorships of each hub company (default: 2000).')
+    argparser.add_argument('-ar', '--address_reuse', default=os.getenv('address_reuse', 0.5), type=float, help='share of things sharing address with other things (default: 0.5).')
+    argparser.add_argument('-g', '--generate_only', default=os.getenv('generate_only', False), type=bool, help='optional bool arg (default: False), if set to True - only corpus file is generated.')
+    argparser.add_argument('-t', '--number_of_threads', default=os.getenv('number_of_threads', 4), type=int, help='number of loader threads (default: 4).')
+    argparser.add_argument('-r', '--results_file', default=os.getenv('results_file', 'benchmark_results.jsonl'), type=str, help='file to append results to (default: benchmark_results.jsonl).')
+    argparser.add_argument('-nm', '--name', default=os.getenv('name', None), type=str, help='optional name of benchmarked version (e.g. git commit).')
+    argparser.add_argument('-l', '--log_file', default=os.getenv('log_file', None), type=str, help='optional statistics filename.')
+    args = argparser.parse_args()
+    if args.log_file:
+        logging.basicConfig(filename = args.log_file,
+                            filemode = 'a',
+                            format = '%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s',
+                            datefmt = '%H:%M:%S',
+                            level = logging.INFO)
+    else:
+        logging.basicConfig(level = logging.INFO)
+    log = logging.getLogger("benchmark_script")
+
+    params = {"entities": args.entities, "seed": args.seed, "company_ratio": args.company_ratio, "interval_density": args.interval_density,
+              "hubs": args.hubs, "hub_size": args.hub_size, "address_reuse": args.address_reuse}
+    corpus_file = args.corpus_file or tempfile.NamedTemporaryFile(suffix = '.json', delete = False).name
+    try:
+        if not args.corpus_file or not os.path.exists(corpus_file):
+            generate_corpus(corpus_file, log, **params)
+        if args.generate_only:
+            sys.exit(0)
+        if args.corpus_file:
+            params = {"corpus_file": os.path.basename(corpus_file), "corpus_bytes": os.path.getsize(corpus_file)}
+        metrics = run_benchmark(corpus_file, "BENCHMARK", log, args.number_of_threads)
+        result = {"name": args.name or "", "time": datetime.now().isoformat(timespec = 'seconds'), "params": params,
+                  "json_codec": json_codec.backend, "python": platform.python_version(), "metrics": metrics}
+        log_comparison(metrics, previous_result(args.results_file, params), log)
+        with open(args.results_file, "a", encoding="utf-8") as fh:
+            fh.write(json_codec.dumps(result))
+            fh.write("\n")
+        log.info('Results saved to ' + args.results_file)
+        sys.exit(0)
+    except Exception as err:
+        log.info('Error occured!')
+        log.info(' %s' % err)
+        sys.exit(1)
+    finally:
+        if not args.corpus_file and os.path.exists(corpus_file):
+            os.remove(corpus_file)
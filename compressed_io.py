@@ -0,0 +1,65 @@
+import gzip
+import io
+
+# streaming text files for mapper and loader: compression is detected by file extension
+# .gz - gzip (stdlib), .zst/.zstd - zstandard (needs pip install zstandard), other extensions - plain text
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_EXTENSIONS = (".gz", ".gzip")
+ZSTD_EXTENSIONS = (".zst", ".zstd")
+
+GZIP_LEVEL = 6 # default 9 is several times slower for almost the same size
+ZSTD_LEVEL = 3
+
+def detect_compression(filename):
+    lower_name = filename.lower()
+    if lower_name.endswith(GZIP_EXTENSIONS):
+        return "gzip"
+    if lower_name.endswith(ZSTD_EXTENSIONS):
+        return "zstd"
+    return None
+
+def is_compressed(filename):
+    return detect_compression(filename) is not None
+
+# open text file for reading ("r") or writing ("w"/"a"), decompressing/compressing on the fly
+# compression is detected by filename unless given ("gzip", "zstd" or "" for plain text), e.g. for temporary files
+def open_text(filename, mode = "r", encoding = "utf-8", compression = None):
+    kind = detect_compression(filename) if compression is None else compression
+    if kind == "gzip":
+        return gzip.open(filename, mode + "t", encoding = encoding, compresslevel = GZIP_LEVEL)
+    if kind == "zstd":
+        if zstandard is None:
+            raise ImportError('zstandard package is required for ' + filename + ' (pip install zstandard)')
+        if mode == "r":
+            stream = zstandard.ZstdDecompressor().stream_reader(open(filename, "rb"), read_across_frames = True, closefd = True)
+        else:
+            stream = zstandard.ZstdCompressor(level = ZSTD_LEVEL).stream_writer(open(filename, mode + "b"), closefd = True)
+        return io.TextIOWrapper(stream, encoding = encoding)
+    return open(filename, mode, encoding = encoding)
+
+# open file for binary reading, decompressing on the fly (lines are bytes, e.g. for byte offsets of checkpoints)
+def open_binary(filename):
+    kind = detect_compression(filename)
+    if kind == "gzip":
+        return gzip.open(filename, "rb")
+    if kind == "zstd":
+        if zstandard is None:
+            raise ImportError('zstandard package is required for ' + filename + ' (pip install zstandard)')
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(filename, "rb"), read_across_frames = True, closefd = True))
+    return open(filename, "rb")
+
+# move binary file to offset (in decompressed bytes), compressed streams are read up to offset
+def skip_to(fh, offset, block_size = 2**20):
+    if fh.seekable():
+        fh.seek(offset)
+        return
+    while offset > 0:
+        block = fh.read(min(block_size, offset))
+        if not block:
+            raise EOFError('file is shorter than offset')
+        offset -= len(block)
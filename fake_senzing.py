@@ -0,0 +1,249 @@
+import json
+import time
+import zlib
+import random
+import threading
+import itertools
+import collections
+
+# in-process stand-in for Senzing G2Engine, G2ConfigMgr and G2Config: nothing is stored, no Senzing install or DB is needed, so loader and redo
+# could be benchmarked and tested offline. It is selected by "FAKE_SENZING" object in init settings file (see fake_senzing_settings.json), options:
+#   latency_ms, latency_jitter_ms - duration of each addRecord/processRedoRecord call (plus uniform random jitter), calls sleep without GIL as Senzing does
+#   errors - probability of failed call by error class of senzing_utils.classify_error, e.g. {"retryable": 0.01, "bad_input": 0.001}
+#   redo_ratio - probability that added record queues redo record, redo_backlog - number of redo records queued at start
+#   data_sources - data sources of initial config, records of other data sources fail as in Senzing (by default any data source is accepted)
+#   config_change_seconds - default config ID is changed every N seconds (as if new config was added by other process)
+#   seed - seed of random latencies, errors and redos
+# state (configs, redo queue) is shared by all fake objects of process, each process of multi-process load has its own
+
+try:
+    from senzing import G2Exception, G2BadInputException, G2MissingConfigurationException, G2MissingDataSourceException, G2RetryableException, G2UnrecoverableException
+except ImportError: # same hierarchy as in senzing package, so errors are classified the same way without it
+    class G2Exception(Exception):
+        pass
+
+    class G2BadInputException(G2Exception):
+        pass
+
+    class G2MissingConfigurationException(G2BadInputException):
+        pass
+
+    class G2MissingDataSourceException(G2BadInputException):
+        pass
+
+    class G2RetryableException(G2Exception):
+        pass
+
+    class G2UnrecoverableException(G2Exception):
+        pass
+
+# exception raised for injected error of each class
+ERRORS = {"retryable": G2RetryableException, "config": G2MissingDataSourceException, "bad_input": G2BadInputException,
+          "unrecoverable": G2UnrecoverableException, "error": G2Exception}
+
+# data sources of Senzing config template
+TEMPLATE_DATA_SOURCES = ("TEST", "SEARCH")
+
+# state of fake Senzing of process, set by configure()
+repository = None
+
+# config IDs are passed as bytearrays by senzing_utils (as Senzing returns them)
+def config_id_value(config_id):
+    return int(config_id.decode() if isinstance(config_id, (bytes, bytearray)) else config_id)
+
+# config JSON with data sources (the part of Senzing config that fake engine uses)
+def config_json(data_sources):
+    return json.dumps({"G2_CONFIG": {"CFG_DSRC": [{"DSRC_ID": dsrc_id, "DSRC_CODE": code} for dsrc_id, code in enumerate(data_sources, 1)]}})
+
+def config_data_sources(config):
+    return [data_source["DSRC_CODE"] for data_source in json.loads(config)["G2_CONFIG"]["CFG_DSRC"]]
+
+# withInfo response of record, each record is resolved to its own entity with stable ID
+def info_json(data_source, record_id):
+    return json.dumps({"DATA_SOURCE": data_source, "RECORD_ID": record_id, "AFFECTED_ENTITIES": [{"ENTITY_ID": zlib.crc32((data_source + '|' + record_id).encode()) + 1}],
+                       "INTERESTING_ENTITIES": {"ENTITIES": []}})
+
+class FakeRepository:
+
+    def __init__(self, options):
+        unknown_errors = set(options.get("errors", {})) - set(ERRORS)
+        if unknown_errors:
+            raise ValueError('unknown error classes in FAKE_SENZING errors: ' + ', '.join(sorted(unknown_errors)) + ' (known: ' + ', '.join(ERRORS) + ')')
+        self.options = options
+        self.latency = options.get("latency_ms", 0) / 1000
+        self.jitter = options.get("latency_jitter_ms", 0) / 1000
+        self.errors = [(ERRORS[error_class], error_class, probability) for error_class, probability in options.get("errors", {}).items() if probability]
+        self.redo_ratio = options.get("redo_ratio", 0)
+        self.config_change_seconds = options.get("config_change_seconds", 0)
+        self.random = random.Random(options.get("seed"))
+        self.lock = threading.RLock()
+        data_sources = options.get("data_sources")
+        self.check_data_sources = data_sources is not None
+        self.configs = {} # config ID -> (config JSON, set of data sources)
+        self.default_config_id = self.add_config(config_json(list(TEMPLATE_DATA_SOURCES) + [code.upper() for code in data_sources or []]))
+        self.default_changed_at = time.monotonic()
+        self.redo_queue = collections.deque(json.dumps({"REASON": "fake redo", "DATA_SOURCE": "TEST", "RECORD_ID": str(number)})
+                                            for number in range(options.get("redo_backlog", 0)))
+
+    def add_config(self, config):
+        with self.lock:
+            config_id = max(self.configs, default = 0) + 1
+            self.configs[config_id] = (config, set(config_data_sources(config)))
+            return config_id
+
+    def get_config(self, config_id):
+        config_id = config_id_value(config_id)
+        if config_id not in self.configs:
+            raise G2BadInputException('fake Senzing has no config with ID %d' % config_id)
+        return config_id, self.configs[config_id]
+
+    def get_default_config_id(self):
+        with self.lock:
+            if self.config_change_seconds and time.monotonic() - self.default_changed_at >= self.config_change_seconds:
+                self.set_default_config_id(self.add_config(self.configs[self.default_config_id][0]))
+            return self.default_config_id
+
+    def set_default_config_id(self, config_id):
+        self.default_config_id = self.get_config(config_id)[0]
+        self.default_changed_at = time.monotonic()
+
+    # latency and injected errors of engine call
+    def call(self):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + self.random.uniform(0, self.jitter))
+        for error, error_class, probability in self.errors:
+            if self.random.random() < probability:
+                raise error('fake Senzing %s error' % error_class)
+
+    def add_record(self, config_id, data_source, record_id):
+        self.call()
+        if self.check_data_sources and data_source.upper() not in self.configs[config_id][1]:
+            raise G2MissingDataSourceException('0023E|Conflicting DATA_SOURCE values [%s] (not in fake Senzing config %d)' % (data_source, config_id))
+        if self.redo_ratio and self.random.random() < self.redo_ratio:
+            self.redo_queue.append(json.dumps({"REASON": "fake redo", "DATA_SOURCE": data_source, "RECORD_ID": record_id}))
+
+    # redo record processed or None if queue is empty
+    def process_redo(self):
+        self.call()
+        try:
+            return self.redo_queue.popleft()
+        except IndexError:
+            return None
+
+# fake classes (G2Engine, G2ConfigMgr, G2Config) with state created from options, the same options keep state of previous call
+def configure(options):
+    global repository
+    if repository is None or repository.options != options:
+        repository = FakeRepository(options)
+    return FakeG2Engine, FakeG2ConfigMgr, FakeG2Config
+
+def check_configured():
+    if repository is None:
+        raise G2Exception('fake Senzing is not configured (FAKE_SENZING in init settings)')
+
+class FakeG2Engine:
+
+    def init(self, engine_name_, ini_params_, debug_ = False):
+        check_configured()
+        self.active_config_id = repository.get_default_config_id()
+
+    def reinit(self, initConfigID_):
+        self.active_config_id = repository.get_config(initConfigID_)[0]
+
+    def primeEngine(self):
+        pass
+
+    def getActiveConfigID(self, configID):
+        configID.extend(str(self.active_config_id).encode())
+
+    def addRecord(self, dataSourceCode, recordId, jsonData, load_id = None):
+        repository.add_record(self.active_config_id, dataSourceCode, recordId)
+
+    def addRecordWithInfo(self, dataSourceCode, recordId, jsonData, response, load_id = None, flags = 0):
+        repository.add_record(self.active_config_id, dataSourceCode, recordId)
+        response.extend(info_json(dataSourceCode, recordId).encode())
+
+    def processRedoRecord(self, response, flags = 0):
+        redo = repository.process_redo()
+        if redo:
+            response.extend(redo.encode())
+
+    def processRedoRecordWithInfo(self, response, info, flags = 0):
+        redo = repository.process_redo()
+        if redo:
+            response.extend(redo.encode())
+            redo_record = json.loads(redo)
+            info.extend(info_json(redo_record["DATA_SOURCE"], redo_record["RECORD_ID"]).encode())
+
+    def countRedoRecords(self):
+        return len(repository.redo_queue)
+
+    def getLastException(self):
+        return ''
+
+    def destroy(self):
+        pass
+
+class FakeG2ConfigMgr:
+
+    def init(self, module_name_, ini_params_, debug_ = False):
+        check_configured()
+
+    def getDefaultConfigID(self, configID):
+        configID.extend(str(repository.get_default_config_id()).encode())
+
+    def setDefaultConfigID(self, configID):
+        repository.set_default_config_id(configID)
+
+    def getConfig(self, configID, response):
+        response.extend(repository.get_config(configID)[1][0].encode())
+
+    def addConfig(self, configStr, configComments, configID):
+        configID.extend(str(repository.add_config(configStr.decode() if isinstance(configStr, (bytes, bytearray)) else configStr)).encode())
+
+    def getConfigList(self, response):
+        response.extend(json.dumps({"CONFIGS": [{"CONFIG_ID": config_id} for config_id in sorted(repository.configs)]}).encode())
+
+    def destroy(self):
+        pass
+
+class FakeG2Config:
+
+    def __init__(self):
+        self.handles = {} # config handle -> list of data sources
+        self.handle_numbers = itertools.count(1)
+
+    def init(self, module_name_, ini_params_, debug_ = False):
+        check_configured()
+
+    def create(self):
+        config_handle = next(self.handle_numbers)
+        self.handles[config_handle] = list(TEMPLATE_DATA_SOURCES)
+        return config_handle
+
+    def load(self, jsonConfig):
+        config_handle = next(self.handle_numbers)
+        self.handles[config_handle] = config_data_sources(jsonConfig.decode() if isinstance(jsonConfig, (bytes, bytearray)) else jsonConfig)
+        return config_handle
+
+    def save(self, configHandle, response):
+        response.extend(config_json(self.handles[configHandle]).encode())
+
+    def addDataSource(self, configHandle, inputJson, response):
+        code = json.loads(inputJson)["DSRC_CODE"].upper()
+        if code in self.handles[configHandle]:
+            raise G2BadInputException('7221E|Data source code [%s] already exists.' % code)
+        self.handles[configHandle].append(code)
+        response.extend(json.dumps({"DSRC_ID": len(self.handles[configHandle])}).encode())
+
+    def listDataSources(self, configHandle, response):
+        response.extend(json.dumps({"DATA_SOURCES": [{"DSRC_ID": dsrc_id, "DSRC_CODE": code} for dsrc_id, code in enumerate(self.handles[configHandle], 1)]}).encode())
+
+    def close(self, configHandle):
+        self.handles.pop(configHandle, None)
+
+    def clearLastException(self):
+        pass
+
+    def destroy(self):
+        pass
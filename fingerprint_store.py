@@ -0,0 +1,59 @@
+import hashlib
+import json
+import sqlite3
+
+# canonical JSON of mapped record: keys and list items sorted, so fingerprint doesn't depend on FtM values order
+def canonical_json(value):
+    if isinstance(value, dict):
+        return '{' + ','.join(json.dumps(key) + ':' + canonical_json(value[key]) for key in sorted(value)) + '}'
+    if isinstance(value, list):
+        return '[' + ','.join(sorted(canonical_json(item) for item in value)) + ']'
+    return json.dumps(value)
+
+# fingerprint of mapped senzing record
+def record_fingerprint(record):
+    return hashlib.blake2b(canonical_json(record).encode(), digest_size = 16).hexdigest()
+
+# persistent store of record id -> fingerprint of mapped record from previous runs (one SQLite file, records of each data source kept apart)
+# changes are committed only by commit(), so failed run leaves fingerprints of previous run untouched
+class FingerprintStore:
+
+    # run - number of resumed run (its records committed at checkpoints are already marked as seen), new run by default
+    def __init__(self, path, data_source, run = None):
+        self.path = path
+        self.data_source = data_source
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS fingerprints (data_source TEXT, record_id TEXT, fingerprint TEXT, run INTEGER, PRIMARY KEY (data_source, record_id))')
+        if run is None:
+            row = self.connection.execute('SELECT MAX(run) FROM fingerprints WHERE data_source = ?', (data_source,)).fetchone()
+            run = (row[0] or 0) + 1
+        self.run = run
+        self.new = 0
+        self.changed = 0
+        self.unchanged = 0
+
+    # mark record as seen in this run, returns True if record is new or changed since previous run
+    def update(self, record_id, fingerprint):
+        row = self.connection.execute('SELECT fingerprint FROM fingerprints WHERE data_source = ? AND record_id = ?', (self.data_source, record_id)).fetchone()
+        self.connection.execute('INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?)', (self.data_source, record_id, fingerprint, self.run))
+        if row is None:
+            self.new += 1
+            return True
+        if row[0] != fingerprint:
+            self.changed += 1
+            return True
+        self.unchanged += 1
+        return False
+
+    # record ids not seen in this run (disappeared from source), removed from store
+    def pop_deleted(self):
+        cursor = self.connection.execute('SELECT record_id FROM fingerprints WHERE data_source = ? AND run < ?', (self.data_source, self.run))
+        deleted = [row[0] for row in cursor]
+        self.connection.execute('DELETE FROM fingerprints WHERE data_source = ? AND run < ?', (self.data_source, self.run))
+        return deleted
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
@@ -1,6 +1,5 @@
-import json
 import logging
-from typing import Dict, List
+from typing import Dict, List, NamedTuple, Optional, Tuple
 import re
 from datetime import datetime
 from followthemoney import model
@@ -11,95 +10,277 @@ import argparse
 import os
 import sys
 import tempfile
-import shutil
+import itertools
+import collections
+import multiprocessing
+import concurrent.futures
+import pickle
+import zlib
+from interval_index import IntervalDict, SqliteIntervalStore, SqliteIntervalIndex
+from fingerprint_store import FingerprintStore, record_fingerprint
+from metrics import StageMetrics, write_atomic
+import json_codec
+import compressed_io
 
-# to get unknown entities
-def catch_unk_entities(source_file, thing_entity_list, intervals_entity_list, OTHER_ENTITIES, log):
+# compact interval records - only fields used in transform are kept instead of full EntityProxy
+class IntervalRecord(NamedTuple):
+    roles: Tuple[str, ...]
+    subjects: Tuple[str, ...]
 
-    log = logging.getLogger(log.name + '.catch_unk_entities_function')
+class PassportRecord(NamedTuple):
+    number: Optional[str]
+    country: Optional[str]
+
+
+# project interval entity to IntervalRecord (roles interned, subjects deduplicated keeping order)
+def interval_record(entity, role_name, subj_name):
+    return IntervalRecord(
+        tuple(sys.intern(role) for role in entity.get(role_name, quiet = True)),
+        tuple(dict.fromkeys(entity.get(subj_name, quiet = True))))
+
+def passport_record(entity):
+    return PassportRecord(entity.first("number"), entity.first("country"))
+
+# render Address entity to senzing address fragment once in index phase, transform only adds ADDR_TYPE
+# (structured address if there are postal code or city, full address otherwise)
+def address_fragment(entity):
+    postal_code = entity.first("postalCode")
+    city = entity.first("city")
+    if postal_code is not None or city is not None:
+        return {
+            "ADDR_LINE1":           entity.first("street"),
+            "ADDR_LINE2":           entity.first("street2"),
+            "ADDR_CITY":            city,
+            "ADDR_STATE":           entity.first("state"),
+            "ADDR_COUNTRY":         entity.first("country"),
+            "ADDR_POSTAL_CODE":     postal_code
+        }
+    return {"ADDR_FULL": entity.first("full")}
+
+# open source file for reading, "-" stands for stdin, .gz/.zst files are decompressed on the fly
+def open_source(source_file):
+    if source_file == "-":
+        return open(sys.stdin.fileno(), "r", encoding="utf-8", closefd=False)
+    return compressed_io.open_text(source_file, "r")
+
+# read source file in chunks of lines
+def read_line_chunks(source_file, chunk_size = 1000):
+    with open_source(source_file) as fh:
+        while chunk := list(itertools.islice(fh, chunk_size)):
+            yield chunk
+
+# read batches of thing entities spilled by cache_intervals (single pass mode), spill file is closed at the end
+def read_spilled_batches(spill_file):
+    try:
+        spill_file.seek(0)
+        while True:
+            try:
+                yield pickle.load(spill_file)
+            except EOFError:
+                return
+    finally:
+        spill_file.close()
+
+# log stats about unknown entities (counted per schema while caching intervals)
+def log_unk_entities(OTHER_ENTITIES, log):
+
+    log = logging.getLogger(log.name + '.log_unk_entities_function')
+
+    log.info('found ' + str(sum(OTHER_ENTITIES.values())) +' unknown entities in source file')
+    for schema, count in sorted(OTHER_ENTITIES.items(), key = lambda item: -item[1]):
+        log.info(' %s: %d' % (schema, count))
+
+# for caching interval entities (first pass over source file), unknown entities are counted per schema if OTHER_ENTITIES dict provided
+# if spill_file provided, thing entities are written there (pickled batches of minimal dicts) so source file is read only once
+def cache_intervals(source_file, thing_entity_list, intervals_entity_list,
+                    DIRECTORSHIPS, EMPLOYMENTS, MEMBERSHIPS, REPRESENTATIONS, UNKNOWN_LINKS,  OWNERSHIPS, IDENTIFICATIONS, ADDRESSES, FAMILIES, ASSOCIATIONS, log, OTHER_ENTITIES = None,
+                    spill_file = None, spill_batch_size = 1000, metrics = None, data_source = None, RELATIONSHIPS = None):
+
+    log = logging.getLogger(log.name + '.cache_intervals_function')
 
     start_time = datetime.now()
-    known_types_list = thing_entity_list + intervals_entity_list
-    with open(source_file, "r") as fh:
+    thing_schemata = set(thing_entity_list)
+    intervals_schemata = set(intervals_entity_list)
+    spill_batch = []
+    schema_counts = {}
+    # identical address fragments are shared only in RAM index, on-disk index stores each row as JSON anyway (and RAM must stay flat with it)
+    address_fragments = {} if isinstance(ADDRESSES, IntervalDict) else None
+    log.info("Caching aux entities: %r", source_file)
+    with open_source(source_file) as fh:
         while line := fh.readline():
-            data = json.loads(line)
+            data = json_codec.loads(line)
+            # cheap dispatch on raw schema name, proxy is built only for interval entities
+            schema = data.get("schema")
+            schema_counts[schema] = schema_counts.get(schema, 0) + 1
+            if schema not in intervals_schemata:
+                if schema in thing_schemata:
+                    if spill_file is not None:
+                        spill_batch.append({"id": data.get("id"), "schema": schema, "properties": data.get("properties", {})})
+                        if len(spill_batch) >= spill_batch_size:
+                            pickle.dump(spill_batch, spill_file, pickle.HIGHEST_PROTOCOL)
+                            spill_batch = []
+                elif OTHER_ENTITIES is not None:
+                    OTHER_ENTITIES[schema] = OTHER_ENTITIES.get(schema, 0) + 1
+                continue
+            if schema == "Succession":
+                continue # will be addeed later
             entity = model.get_proxy(data)
-            if not entity.schema.name in known_types_list:
-                OTHER_ENTITIES.append(entity)
-    log.info('found ' + str(len(OTHER_ENTITIES)) +' unknown entities in source file, time spent: ' + str(datetime.now()-start_time))
+            if entity.schema.is_a("Directorship"):
+                record = interval_record(entity, "role", "organization")
+                for director in entity.get("director"):
+                    DIRECTORSHIPS.append(director, record)
+            elif entity.schema.is_a("Employment"):
+                record = interval_record(entity, "role", "eployee")
+                for employer in entity.get("employer"):
+                    EMPLOYMENTS.append(employer, record)
+            elif entity.schema.is_a("Membership"):
+                record = interval_record(entity, "role", "organization")
+                for member in entity.get("member"):
+                    MEMBERSHIPS.append(member, record)
+            elif entity.schema.is_a("Representation"):
+                record = interval_record(entity, "role", "client")
+                for agent in entity.get("agent"):
+                    REPRESENTATIONS.append(agent, record)
+            elif entity.schema.is_a("UnknownLink"):
+                record = interval_record(entity, "role", "object")
+                for subject in entity.get("subject"):
+                    UNKNOWN_LINKS.append(subject, record)
+            elif entity.schema.is_a("Ownership"):
+                record = interval_record(entity, "role", "asset")
+                for owner in entity.get("owner"):
+                    OWNERSHIPS.append(owner, record)
+            elif entity.schema.is_a("Identification"):
+                if not entity.schema.is_a("Passport"):
+                    continue # only passports are used in transform
+                record = passport_record(entity)
+                for holder in entity.get("holder"):
+                    IDENTIFICATIONS.append(holder, record)
+            elif entity.schema.is_a("Address"):
+                fragment = address_fragment(entity)
+                # same address is often published as many Address entities (e.g. registered agents), they share one fragment
+                if address_fragments is not None:
+                    fragment = address_fragments.setdefault(tuple(fragment.items()), fragment)
+                ADDRESSES[entity.id] = fragment
+            elif entity.schema.is_a("Family"):
+                record = interval_record(entity, "relationship", "relative")
+                for person in entity.get("person"):
+                    FAMILIES.append(person, record)
+            elif entity.schema.is_a("Associate"):
+                record = interval_record(entity, "relationship", "associate")
+                for person in entity.get("person"):
+                    ASSOCIATIONS.append(person, record)
+    if spill_batch:
+        pickle.dump(spill_batch, spill_file, pickle.HIGHEST_PROTOCOL)
+    for intervals_dict in (DIRECTORSHIPS, EMPLOYMENTS, MEMBERSHIPS, REPRESENTATIONS, UNKNOWN_LINKS,  OWNERSHIPS, IDENTIFICATIONS, ADDRESSES, FAMILIES, ASSOCIATIONS):
+        intervals_dict.finalize()
+    if metrics:
+        metrics.inc("lines_read", sum(schema_counts.values()))
+        for schema, count in schema_counts.items():
+            metrics.inc("entities", count, schema = schema)
+        for name, intervals_dict in zip(INTERVAL_CATEGORIES, (DIRECTORSHIPS, EMPLOYMENTS, MEMBERSHIPS, REPRESENTATIONS, UNKNOWN_LINKS,  OWNERSHIPS, IDENTIFICATIONS, ADDRESSES, FAMILIES, ASSOCIATIONS)):
+            metrics.set("intervals_cached", intervals_dict.size(), category = name)
+    if RELATIONSHIPS is not None:
+        # relationships order is the same as in transform before (UNKNOWN_LINKS first)
+        anchors = build_relationships(data_source, RELATIONSHIPS, (UNKNOWN_LINKS, OWNERSHIPS, DIRECTORSHIPS, EMPLOYMENTS, MEMBERSHIPS, REPRESENTATIONS, FAMILIES, ASSOCIATIONS))
+        if metrics:
+            metrics.set("relationship_anchors", anchors)
+    log.info("all intervals cached, time spent: " + str(datetime.now()-start_time))
+    if metrics:
+        metrics.add_time("index", (datetime.now()-start_time).total_seconds())
+
+# RELATIONSHIP_LIST of anchor entity from its interval records (anchor first, then pointers as transform added them before), pointer dicts are shared between anchors
+def relationship_fragment(data_source, entity_id, interval_records, pointers):
+    fragment = []
+    for adj in interval_records:
+        for role in adj.roles:
+            if not fragment:
+                fragment.append({
+                    "REL_ANCHOR_DOMAIN": data_source,
+                    "REL_ANCHOR_KEY": entity_id})
+            for subject in adj.subjects:
+                pointer = pointers.get((subject, role))
+                if pointer is None:
+                    pointer = pointers[(subject, role)] = {
+                        "REL_POINTER_DOMAIN": data_source,
+                        "REL_POINTER_KEY": subject,
+                        "REL_POINTER_ROLE": role
+                        }
+                fragment.append(pointer)
+    return fragment
+
+# materialize RELATIONSHIP_LIST of each anchor once after index phase, so transform needs one lookup per record
+# in-memory interval dicts are not needed after that and are cleared, on-disk ones are read grouped by anchor
+# returns number of anchor entities (the same for both index types, unlike size() of index)
+def build_relationships(data_source, RELATIONSHIPS, relationship_dicts):
+    pointers = {}
+    anchors = 0
+    if isinstance(relationship_dicts[0], SqliteIntervalIndex):
+        order = {intervals_dict.name: i for i, intervals_dict in enumerate(relationship_dicts)}
+        decode = relationship_dicts[0].decode
+        for entity_id, rows in relationship_dicts[0].store.fetch_grouped(list(order)):
+            rows.sort(key = lambda row: order[row[0]]) # stable, keeps insertion order inside category
+            RELATIONSHIPS[entity_id] = relationship_fragment(data_source, entity_id, [decode(json_codec.loads(value)) for _, value in rows], pointers)
+            anchors += 1
+            pointers.clear() # shared pointers are only useful in memory
+    else:
+        grouped = {}
+        for intervals_dict in relationship_dicts:
+            for entity_id, interval_records in intervals_dict.items():
+                grouped.setdefault(entity_id, []).extend(interval_records)
+            intervals_dict.clear()
+        for entity_id, interval_records in grouped.items():
+            RELATIONSHIPS[entity_id] = relationship_fragment(data_source, entity_id, interval_records, pointers)
+            anchors += 1
+    RELATIONSHIPS.finalize()
+    return anchors
 
-# for reading known entities
+# for reading known entities (if single_pass - source file is read once, thing entities are read back from local spill file)
 def read_entities (source_file, thing_entity_list, intervals_entity_list, 
-                   DIRECTORSHIPS, EMPLOYMENTS, MEMBERSHIPS, REPRESENTATIONS, UNKNOWN_LINKS,  OWNERSHIPS, IDENTIFICATIONS, ADDRESSES, FAMILIES, ASSOCIATIONS, log):
+                   DIRECTORSHIPS, EMPLOYMENTS, MEMBERSHIPS, REPRESENTATIONS, UNKNOWN_LINKS,  OWNERSHIPS, IDENTIFICATIONS, ADDRESSES, FAMILIES, ASSOCIATIONS, log, OTHER_ENTITIES = None,
+                   single_pass = False, metrics = None, data_source = None, RELATIONSHIPS = None):
     
     log = logging.getLogger(log.name + '.read_entities_function')
     
-    start_time = datetime.now()
+    if single_pass:
+        for batch in read_entity_chunks(source_file, thing_entity_list, intervals_entity_list,
+                                        DIRECTORSHIPS, EMPLOYMENTS, MEMBERSHIPS, REPRESENTATIONS, UNKNOWN_LINKS,  OWNERSHIPS, IDENTIFICATIONS, ADDRESSES, FAMILIES, ASSOCIATIONS, log, OTHER_ENTITIES,
+                                        single_pass = True, metrics = metrics, data_source = data_source, RELATIONSHIPS = RELATIONSHIPS):
+            for data in batch:
+                yield model.get_proxy(data)
+        return
     # Interval entities first - stored in interval Dicts
-    log.info("Caching aux entities: %r", source_file)
-    with open(source_file, "r") as fh:
-        while line := fh.readline():
-            data = json.loads(line)
-            entity = model.get_proxy(data)
-            if entity.schema.name in intervals_entity_list:
-                if entity.schema.is_a("Succession"):
-                    continue # will be addeed later
-                elif entity.schema.is_a("Directorship"):
-                    for director in entity.get("director"):
-                        if director not in DIRECTORSHIPS:
-                            DIRECTORSHIPS[director] = []
-                        DIRECTORSHIPS[director].append(entity)
-                elif entity.schema.is_a("Employment"):
-                    for employer in entity.get("employer"):
-                        if employer not in EMPLOYMENTS:
-                            EMPLOYMENTS[employer] = []
-                        EMPLOYMENTS[employer].append(entity)
-                elif entity.schema.is_a("Membership"):
-                     for member in entity.get("member"):
-                        if member not in MEMBERSHIPS:
-                            MEMBERSHIPS[member] = []
-                        MEMBERSHIPS[member].append(entity)   
-                elif entity.schema.is_a("Representation"):
-                    for agent in entity.get("agent"):
-                        if agent not in REPRESENTATIONS:
-                            REPRESENTATIONS[agent] = []
-                        REPRESENTATIONS[agent].append(entity)
-                elif entity.schema.is_a("UnknownLink"):
-                    for subject in entity.get("subject"):
-                        if subject not in UNKNOWN_LINKS:
-                            UNKNOWN_LINKS[subject] = []
-                        UNKNOWN_LINKS[subject].append(entity)
-                elif entity.schema.is_a("Ownership"):
-                    for owner in entity.get("owner"):
-                        if owner not in OWNERSHIPS:
-                            OWNERSHIPS[owner] = []
-                        OWNERSHIPS[owner].append(entity)
-                elif entity.schema.is_a("Identification"):
-                    for holder in entity.get("holder"):
-                        if holder not in IDENTIFICATIONS:
-                            IDENTIFICATIONS[holder] = []
-                        IDENTIFICATIONS[holder].append(entity)   
-                elif entity.schema.is_a("Address"):
-                    ADDRESSES[entity.id] = entity
-                elif entity.schema.is_a("Family"):
-                    for person in entity.get("person"):
-                        if person not in FAMILIES:
-                            FAMILIES[person] = []
-                        FAMILIES[person].append(entity)
-                elif entity.schema.is_a("Associate"):
-                    for person in entity.get("person"):
-                        if person not in ASSOCIATIONS:
-                            ASSOCIATIONS[person] = []
-                        ASSOCIATIONS[person].append(entity)
-    log.info("all intervals cached, time spent: " + str(datetime.now()-start_time))
+    cache_intervals(source_file, thing_entity_list, intervals_entity_list,
+                    DIRECTORSHIPS, EMPLOYMENTS, MEMBERSHIPS, REPRESENTATIONS, UNKNOWN_LINKS,  OWNERSHIPS, IDENTIFICATIONS, ADDRESSES, FAMILIES, ASSOCIATIONS, log, OTHER_ENTITIES,
+                    metrics = metrics, data_source = data_source, RELATIONSHIPS = RELATIONSHIPS)
     # Thing entities
+    thing_schemata = set(thing_entity_list)
     log.info("Reading entities: %r", source_file)
-    with open(source_file, "r") as fh:
+    with open_source(source_file) as fh:
         while line := fh.readline():
-            data = json.loads(line)
-            entity = model.get_proxy(data)
-            if entity.schema.name in thing_entity_list:
-                yield entity
+            data = json_codec.loads(line)
+            if data.get("schema") in thing_schemata:
+                yield model.get_proxy(data)
+
+# for reading known entities in chunks for transform workers: chunks of source file lines or of already decoded spilled entities (single_pass)
+# intervals are cached before return, so worker processes started afterwards see filled interval dicts
+def read_entity_chunks(source_file, thing_entity_list, intervals_entity_list,
+                       DIRECTORSHIPS, EMPLOYMENTS, MEMBERSHIPS, REPRESENTATIONS, UNKNOWN_LINKS,  OWNERSHIPS, IDENTIFICATIONS, ADDRESSES, FAMILIES, ASSOCIATIONS, log, OTHER_ENTITIES = None,
+                       single_pass = False, chunk_size = 1000, metrics = None, data_source = None, RELATIONSHIPS = None):
+
+    log = logging.getLogger(log.name + '.read_entity_chunks_function')
+
+    if single_pass:
+        spill_file = tempfile.TemporaryFile()
+        cache_intervals(source_file, thing_entity_list, intervals_entity_list,
+                        DIRECTORSHIPS, EMPLOYMENTS, MEMBERSHIPS, REPRESENTATIONS, UNKNOWN_LINKS,  OWNERSHIPS, IDENTIFICATIONS, ADDRESSES, FAMILIES, ASSOCIATIONS, log, OTHER_ENTITIES,
+                        spill_file, chunk_size, metrics = metrics, data_source = data_source, RELATIONSHIPS = RELATIONSHIPS)
+        log.info("Reading entities from spill file")
+        return read_spilled_batches(spill_file)
+    cache_intervals(source_file, thing_entity_list, intervals_entity_list,
+                    DIRECTORSHIPS, EMPLOYMENTS, MEMBERSHIPS, REPRESENTATIONS, UNKNOWN_LINKS,  OWNERSHIPS, IDENTIFICATIONS, ADDRESSES, FAMILIES, ASSOCIATIONS, log, OTHER_ENTITIES,
+                    metrics = metrics, data_source = data_source, RELATIONSHIPS = RELATIONSHIPS)
+    log.info("Reading entities: %r", source_file)
+    return read_line_chunks(source_file, chunk_size)
 
 # get only one attribute     
 def get_attribute(entity, prop, attr, conc = False):
@@ -126,6 +307,79 @@ def get_attribute_list(entity, props, attr):
     list_name = attr + '_LIST'
     return {list_name:[{attr:value} for value in values]}
 
+# compiled FtM -> Senzing mapping for one schema, attributes are tuples of (Senzing attr, FtM props, kind)
+class MappingPlan(NamedTuple):
+    record_type: Optional[str]
+    addr_type: str
+    name_field: str
+    head_attributes: Tuple[Tuple[str, Tuple[str, ...], str], ...]
+    attributes: Tuple[Tuple[str, Tuple[str, ...], str], ...]
+    codes: Tuple[Tuple[str, Tuple[str, ...], str], ...]
+
+DEFAULT_MAPPING_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ftm_senzing_mapping.json")
+MAPPING: Dict = {}
+MAPPING_PLANS: Dict[str, MappingPlan] = {}
+
+# load declarative mapping file (compiled plans are dropped)
+def load_mapping(mapping_file = None):
+    with open(mapping_file or DEFAULT_MAPPING_FILE, "r", encoding="utf-8") as fh:
+        mapping = json_codec.loads(fh.read())
+    MAPPING.clear()
+    MAPPING.update(mapping)
+    MAPPING_PLANS.clear()
+
+# compile mapping entries for schema, props which schema doesn't have are dropped
+def compile_attributes(schema, entries, is_org):
+    attributes = []
+    for entry in entries:
+        if entry.get("org_only") and not is_org:
+            continue
+        if "schemata" in entry and schema.name not in entry["schemata"]:
+            continue
+        props = entry["props"] + (entry.get("org_props", []) if is_org else [])
+        props = tuple(prop for prop in props if schema.get(prop) is not None)
+        if props:
+            attributes.append((entry["attr"], props, entry.get("kind", "single")))
+    return tuple(attributes)
+
+def compile_mapping_plan(schema):
+    if not MAPPING:
+        load_mapping()
+    record_type = MAPPING["record_types"].get(schema.name, MAPPING["default_record_type"])
+    is_org = record_type.get("is_org", False)
+    return MappingPlan(
+        record_type.get("record_type"),
+        record_type["addr_type"],
+        record_type["name_field"],
+        compile_attributes(schema, MAPPING["head_attributes"], is_org),
+        compile_attributes(schema, MAPPING["attributes"], is_org),
+        compile_attributes(schema, MAPPING["codes"], is_org))
+
+# get mapping plan for schema, compiled once per schema
+def get_mapping_plan(schema):
+    plan = MAPPING_PLANS.get(schema.name)
+    if plan is None:
+        plan = MAPPING_PLANS[schema.name] = compile_mapping_plan(schema)
+    return plan
+
+# execute compiled attributes: "single" - first value, "concat" - all values concatenated, "list" - one value or *_LIST of values
+def apply_attributes(record, entity, attributes):
+    for attr, props, kind in attributes:
+        if len(props) == 1:
+            values = entity.get(props[0])
+        else:
+            values = []
+            for prop in props:
+                values += entity.get(prop)
+        if not values:
+            continue
+        if len(values) > 1 and kind == "list":
+            record[attr + "_LIST"] = [{attr: value} for value in values]
+        elif len(values) > 1 and kind == "concat":
+            record[attr] = ''.join(value + ' ' for value in values)
+        else:
+            record[attr] = values[0]
+
 # convert time to list of date and time from iso (not used for now, but maybe might be helpful for some data)
 def split_time(timestring):
     return [v for v in re.findall(r'[^T]*', timestring) if v != '']
@@ -134,56 +388,24 @@ def split_time(timestring):
 def weak_alias_split(weak_alias):
     return weak_alias.split('\n')
 
-# for disclosed relationships
-def create_disclosed_relashionships(data_source, relationship_list, intervals_dict, entity_id, role_name, subj_name, anchor):
-        for adj in intervals_dict.get(entity_id, []):
-            for role in adj.get(role_name, quiet = True):
-                if not anchor:
-                    relationship_list += [{
-                        "REL_ANCHOR_DOMAIN": data_source,
-                        "REL_ANCHOR_KEY": entity_id}]
-                    anchor = True
-                for subject in set(adj.get(subj_name, quiet = True)):
-                    relationship_list += [{
-                        "REL_POINTER_DOMAIN": data_source,
-                        "REL_POINTER_KEY": subject,
-                        "REL_POINTER_ROLE": role
-                        }]
-        return  relationship_list, anchor
+# counters of transform in this process (relationships, addresses_resolved, addresses_missing), workers send them with each chunk
+TRANSFORM_COUNTERS = collections.Counter()
 
 # map_record function        
 def transform(data_source: str, entity: EntityProxy,
-                   DIRECTORSHIPS, EMPLOYMENTS, MEMBERSHIPS, REPRESENTATIONS, UNKNOWN_LINKS,  OWNERSHIPS, IDENTIFICATIONS, ADDRESSES, FAMILIES, ASSOCIATIONS, alias_split = True):
+                   RELATIONSHIPS, IDENTIFICATIONS, ADDRESSES, alias_split = True):
     entity = helpers.simplify_provenance(entity) # for removing prefix dates and so on
+    # DATA_SOURCE and RECORD_ID must stay first keys, loader reads them from line prefix (json_codec.record_keys)
     record = {
         "DATA_SOURCE": data_source,
         "RECORD_ID": entity.id,
     }
-    is_org = False
-    if entity.schema.name == "Person":
-        record["RECORD_TYPE"] = "PERSON"
-        addr_type  =     "HOME"
-        name_field =     "NAME_FULL"
-        attr = get_attribute_list(entity, ["country"], "CITIZENSHIP")
-        if attr["CITIZENSHIP_LIST"]:
-            if len(attr["CITIZENSHIP_LIST"]) > 1:
-                record.update(attr)
-            else:
-                record.update(attr["CITIZENSHIP_LIST"][0])
-    elif entity.schema.name in ("Organization", "Company", "PublicBody"):
-        record["RECORD_TYPE"] = "ORGANIZATION"
-        addr_type  =    "BUSINESS"
-        name_field =    "NAME_ORG"
-        attr = get_attribute_list(entity, ["mainCountry"], "REGISTRATION_COUNTRY")
-        if attr["REGISTRATION_COUNTRY_LIST"]:
-            if len(attr["REGISTRATION_COUNTRY_LIST"]) > 1:
-                record.update(attr)
-            else:
-                record.update(attr["REGISTRATION_COUNTRY_LIST"][0])
-        is_org = True
-    else:
-        addr_type = "LEGAL"
-        name_field = "NAME_FULL"
+    plan = get_mapping_plan(entity.schema)
+    if plan.record_type:
+        record["RECORD_TYPE"] = plan.record_type
+    addr_type = plan.addr_type
+    name_field = plan.name_field
+    apply_attributes(record, entity, plan.head_attributes)
     name_list = []
     for name in entity.get_type_values(registry.name): # fof a while not using firstName, secondName, middleName, lastName, fatherName, motherName
         name_type = "PRIMARY" if name == entity.caption else "ALIAS"
@@ -206,24 +428,11 @@ def transform(data_source: str, entity: EntityProxy,
     for addr_id in entity.get("addressEntity"):
         addr = ADDRESSES.get(addr_id)
         if addr is None:
+            TRANSFORM_COUNTERS["addresses_missing"] += 1
             continue
-        elif (addr.has("postalCode") or addr.has("city")):
-                addr_data = {
-                    "ADDR_TYPE":            addr_type,
-                    "ADDR_LINE1":           addr.first("street"),
-                    "ADDR_LINE2":           addr.first("street2"),
-                    "ADDR_CITY":            addr.first("city"),
-                    "ADDR_STATE":           addr.first("state"),
-                    "ADDR_COUNTRY":         addr.first("country"),
-                    "ADDR_POSTAL_CODE":     addr.first("postalCode")
-                }
-        else:
-            addr_data = {
-                "ADDR_TYPE": addr_type,
-                "ADDR_FULL": addr.first("full")
-                }
+        TRANSFORM_COUNTERS["addresses_resolved"] += 1
+        addr_list.append({"ADDR_TYPE": addr_type, **addr})
         addr_type = "OTHER"
-        addr_list.append(addr_data)
     for value in entity.get('address', quiet=True):
         addr_data = {
             "ADDR_TYPE": addr_type,
@@ -238,149 +447,394 @@ def transform(data_source: str, entity: EntityProxy,
             record["GENDER"] = "M"
         if gender == "female":
             record["GENDER"] = "F"
-    map_dict_single = {
-        "DATE_OF_BIRTH":        "birthDate", 
-        "DATE_OF_DEATH":        "deathDate", 
-        "PLACE_OF_BIRTH":       "birthPlace", 
-        "NATIONALITY":          "nationality", 
-        "REGISTRATION_DATE":    "incorporationDate", 
-        "NATIONAL_ID_NUMBER":   "idNumber", 
-        "TAX_ID_NUMBER":        "taxNumber"
-        }
-    for key, value in map_dict_single.items():
-        attr = get_attribute(entity, value, key)
-        if attr[key]:
-            record.update(attr)
-    map_dict_lists = {
-        "WEBSITE_ADDRESS":          ["website"], 
-        "EMAIL_ADDRESS":            ["email"], 
-        "PHONE_NUMBER":             ["phone"],
-        "COUNTRY_OF_ASSOCIATION":   ["jurisdiction"]  
-        }
-    if is_org:
-        map_dict_lists["COUNTRY_OF_ASSOCIATION"].append('country')
-    for key, value in map_dict_lists.items():
-        attr = get_attribute_list(entity, value, key)
-        if attr[key + '_LIST']:
-            if len(attr[key + "_LIST"]) > 1:
-                record.update(attr)
-            else:
-                record.update(attr[key + "_LIST"][0])
-    relationship_list = []
-    anchor = False   
-    relationship_list, anchor = create_disclosed_relashionships(data_source, relationship_list, UNKNOWN_LINKS,      entity.id,  'role',         'object',       anchor)
-    relationship_list, anchor = create_disclosed_relashionships(data_source, relationship_list, OWNERSHIPS,         entity.id,  'role',         'asset',        anchor)        
-    relationship_list, anchor = create_disclosed_relashionships(data_source, relationship_list, DIRECTORSHIPS,      entity.id,  'role',         'organization', anchor)
-    relationship_list, anchor = create_disclosed_relashionships(data_source, relationship_list, EMPLOYMENTS,        entity.id,  'role',         'eployee',      anchor)
-    relationship_list, anchor = create_disclosed_relashionships(data_source, relationship_list, MEMBERSHIPS,        entity.id,  'role',         'organization',  anchor)
-    relationship_list, anchor = create_disclosed_relashionships(data_source, relationship_list, REPRESENTATIONS,    entity.id,  'role',         'client',       anchor)
-    relationship_list, anchor = create_disclosed_relashionships(data_source, relationship_list, FAMILIES,           entity.id,  'relationship', 'relative',     anchor)
-    relationship_list, anchor = create_disclosed_relashionships(data_source, relationship_list, ASSOCIATIONS,       entity.id,  'relationship', 'associate',    anchor)
+    apply_attributes(record, entity, plan.attributes)
+    relationship_list = RELATIONSHIPS.get(entity.id) # prebuilt in index phase
     if relationship_list:
         record.update({"RELATIONSHIP_LIST":relationship_list})
+        TRANSFORM_COUNTERS["relationships"] += len(relationship_list) - 1 # without anchor
     for adj in IDENTIFICATIONS.get(entity.id, []):
-        if adj.schema.is_a("Passport"):
-                record.update({
-                    "PASSPORT_NUMBER":  adj.first("number"),
-                    "PASSPORT_COUNTRY": adj.first("country"),
-                })
+        record.update({
+            "PASSPORT_NUMBER":  adj.number,
+            "PASSPORT_COUNTRY": adj.country,
+        })
     if 'PASSPORT_NUMBER' not in record.keys():
         attr = get_attribute(entity, "passportNumber", "PASSPORT_NUMBER")
         if attr["PASSPORT_NUMBER"]:
             record.update(attr) 
-    
-    map_dict_list = {
-    "INN_CODE":         "innCode",
-    "VAT_CODE":         "vatCode",
-    "DUNS_NUMBER":      "dunsCode", 
-    "SWIFT_BIC_CODE":   "swiftBic", 
-    "ICIJ_ID_CODE":     "icijId",
-    "OKPO_CODE":        "okpoCode",
-    "BVDID_CODE":       "bvdid"  
-    }
-    if is_org:
-        map_dict_list.update({
-        "VOEN_CODE":        "voenCode",
-        "BIK_CODE":         "bikCode",
-        "IRS_CODE":         "irsCode",
-        "IPO_CODE":         "ipoCode",
-        "CIK_CODE":         "cikCode",
-        "JIB_CODE":         "jibCode",
-        "CAEM_CODE":        "caemCode",
-        "COATO_CODE":       "coatoCode",
-        #"MBS_CODE":        "mbsCode",
-        #"IBC_RUC_CODE":    "ibcRuc",
-        "OGRN_CODE":        "ogrnCode",
-        "PRF_NUMBER_CODE":  "pfrNumber",
-        "OKSM_CODE":        "oksmCode"
-        })
-    for key, value in map_dict_list.items():
-        attr = get_attribute(entity, value, key)
-        if attr[key]:
-            record.update(attr)
+    apply_attributes(record, entity, plan.codes)
     return record
 
+# serialize mapped record, returns (record id, senzing JSON line, fingerprint or None)
+def serialize_record(record, fingerprints = False):
+    return record["RECORD_ID"], json_codec.dumps_record(record), record_fingerprint(record) if fingerprints else None
+
+# transform entities in main process, yields serialized records
+def transform_entities(entities, data_source, intervals_dicts, alias_split, fingerprints = False):
+    for entity in entities:
+        record = transform(data_source, entity, *intervals_dicts, alias_split)
+        yield serialize_record(record, fingerprints)
+
+# state of transform worker process, set once by init_transform_worker
+_transform_worker_state = None
+
+# init transform worker process with read-only interval dicts
+def init_transform_worker(data_source, thing_entity_list, intervals_dicts, alias_split, mapping_file, fingerprints):
+    global _transform_worker_state
+    if not MAPPING:
+        load_mapping(mapping_file) # not inherited from main process with spawn
+    _transform_worker_state = (data_source, set(thing_entity_list), intervals_dicts, alias_split, fingerprints)
+    TRANSFORM_COUNTERS.clear()
+
+# transform chunk of source file lines (str or bytes) or of already decoded entities, returns serialized records
+def transform_lines(chunk, data_source, thing_schemata, intervals_dicts, alias_split, fingerprints = False):
+    records = []
+    for item in chunk:
+        data = json_codec.loads(item) if isinstance(item, (str, bytes)) else item
+        if data.get("schema") in thing_schemata:
+            entity = model.get_proxy(data)
+            records.append(serialize_record(transform(data_source, entity, *intervals_dicts, alias_split), fingerprints))
+    return records
+
+# transform chunk in worker process, returns serialized records and transform counters of chunk
+def transform_chunk(chunk):
+    records = transform_lines(chunk, *_transform_worker_state)
+    counters = dict(TRANSFORM_COUNTERS)
+    TRANSFORM_COUNTERS.clear()
+    return records, counters
+
+# transform chunks of entities in process pool (intervals must be cached already), yields serialized records
+# if tagged - chunks are (tag, chunk) pairs and (tag, records of chunk) pairs are yielded in chunks order (e.g. for checkpoints)
+def transform_entities_in_pool(chunks, data_source, thing_entity_list, intervals_dicts, alias_split, workers, log, ordered = True, mapping_file = None, fingerprints = False,
+                               tagged = False):
+
+    log = logging.getLogger(log.name + '.transform_entities_in_pool_function')
+
+    log.info("Transforming entities with %d workers", workers)
+    # with fork workers share interval dicts with main process instead of getting pickled copies
+    mp_context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+    with concurrent.futures.ProcessPoolExecutor(workers, mp_context = mp_context, initializer = init_transform_worker,
+                                                initargs = (data_source, thing_entity_list, intervals_dicts, alias_split, mapping_file, fingerprints)) as executor:
+        if not tagged:
+            chunks = ((None, chunk) for chunk in chunks)
+        # only few chunks per worker are kept in flight
+        futures = collections.deque((tag, executor.submit(transform_chunk, chunk)) for tag, chunk in itertools.islice(chunks, workers * 4))
+        if ordered or tagged:
+            while futures:
+                tag, future = futures.popleft()
+                records, counters = future.result()
+                TRANSFORM_COUNTERS.update(counters)
+                for tag_, chunk in itertools.islice(chunks, 1):
+                    futures.append((tag_, executor.submit(transform_chunk, chunk)))
+                if tagged:
+                    yield tag, records
+                else:
+                    yield from records
+        else:
+            futures = set(future for _, future in futures)
+            while futures:
+                done, futures = concurrent.futures.wait(futures, return_when = concurrent.futures.FIRST_COMPLETED)
+                for _, chunk in itertools.islice(chunks, len(done)):
+                    futures.add(executor.submit(transform_chunk, chunk))
+                for fut in done:
+                    records, counters = fut.result()
+                    TRANSFORM_COUNTERS.update(counters)
+                    yield from records
+
+# names of interval dicts, in order of cache_intervals arguments
+INTERVAL_CATEGORIES = ["DIRECTORSHIPS", "EMPLOYMENTS", "MEMBERSHIPS", "REPRESENTATIONS", "UNKNOWN_LINKS", "OWNERSHIPS", "IDENTIFICATIONS", "ADDRESSES", "FAMILIES", "ASSOCIATIONS"]
+
+# lists of entity types used in mapper
+THING_ENTITY_LIST = ["Person", "Organization", "Company", "LegalEntity", "PublicBody"] # "Asset" - not used for now
+INTEREST_ENTITY_LIST = ["Succession", "Directorship", "Employment", "Membership", "Representation", "UnknownLink", "Ownership"]# "ProjectParticipant", "ContractAward", "Documentation", "CourtCaseParty" - not used for now
+INTERVALS_ENTITY_LIST = INTEREST_ENTITY_LIST + ["Identification", "Address", "Family", "Associate"]
+
+# name of output shard file: out.json.gz -> out_001_of_004.json.gz
+def shard_file_name(output_file, shard, shards):
+    base, compression_ext = output_file, ''
+    if compressed_io.is_compressed(output_file):
+        base, compression_ext = os.path.splitext(output_file)
+    base, ext = os.path.splitext(base)
+    return '%s_%03d_of_%03d%s%s' % (base, shard + 1, shards, ext, compression_ext)
+
+# shard of record, crc32 (unlike hash()) doesn't depend on PYTHONHASHSEED, so record goes to the same shard on every run
+def record_shard(record_id, shards):
+    return zlib.crc32(record_id.encode()) % shards
+
+# write serialized records to output (shard) files, records unchanged since previous run are skipped, returns number of written records
+def write_records(records, target_files, shards, fingerprint_store):
+    records_written = 0
+    target_file = target_files[0]
+    for record_id, line, fingerprint in records:
+        if fingerprint_store and not fingerprint_store.update(record_id, fingerprint):
+            continue # unchanged since previous run
+        records_written += 1
+        if shards > 1:
+            target_file = target_files[record_shard(record_id, shards)]
+        target_file.write(line)
+        target_file.write("\n")
+    return records_written
+
+# default number of records between checkpoints of resumable run
+DEFAULT_CHECKPOINT_EVERY = 100000
+
+# read source file in chunks of lines (bytes) from offset, yields (offset after chunk, chunk)
+def read_offset_chunks(source_file, offset = 0, chunk_size = 1000):
+    with compressed_io.open_binary(source_file) as fh:
+        compressed_io.skip_to(fh, offset)
+        while chunk := list(itertools.islice(fh, chunk_size)):
+            offset += sum(map(len, chunk))
+            yield offset, chunk
+
+# open .part file of output file, compressed by extension of output file
+def open_output_part(file_name, mode = "w"):
+    return compressed_io.open_text(file_name + '.part', mode, compression = compressed_io.detect_compression(file_name) or "")
+
+# checkpoint of resumable run: output (shard) files are closed to get their sizes (finishing gzip member/zstd frame), fingerprints committed
+# and checkpoint saved with input offset, returns reopened output files
+def save_checkpoint(checkpoint_file, checkpoint, target_files, output_files, fingerprint_store):
+    output_sizes = []
+    for target_file, file_name in zip(target_files, output_files):
+        target_file.close()
+        output_sizes.append(os.path.getsize(file_name + '.part'))
+    if fingerprint_store:
+        fingerprint_store.commit()
+    checkpoint["output_sizes"] = output_sizes
+    write_atomic(checkpoint_file, json_codec.dumps(checkpoint))
+    return [open_output_part(file_name, "a") for file_name in output_files]
+
+# checkpoint of interrupted run, None if there is no checkpoint or it belongs to another run
+def load_checkpoint(checkpoint_file, source_file, data_source, shards, output_files, index_file, log):
+
+    log = logging.getLogger(log.name + '.load_checkpoint_function')
+
+    if not os.path.exists(checkpoint_file):
+        log.info('No checkpoint found, starting from scratch')
+        return None
+    with open(checkpoint_file, "r", encoding="utf-8") as fh:
+        checkpoint = json_codec.loads(fh.read())
+    if (checkpoint.get("source_file"), checkpoint.get("data_source"), checkpoint.get("shards")) != (os.path.abspath(source_file), data_source, shards):
+        log.info('Checkpoint belongs to another run (source file, data source or shards differ), starting from scratch')
+        return None
+    if not os.path.exists(index_file) or not all(os.path.exists(file_name + '.part') for file_name in output_files):
+        log.info('Index or partial output files of interrupted run are missing, starting from scratch')
+        return None
+    return checkpoint
+
 # process ftm entities to senzing entities function
-def process_entities(data_source, source_file, log = None, alias_split = True, catch_unknown_entities = False):
+def process_entities(data_source, source_file, log = None, alias_split = True, catch_unknown_entities = False, index_file = None, workers = 1, ordered = True, mapping_file = None, single_pass = False,
+                     fingerprint_file = None, deleted_file = None, output_file = None, shards = 1, stats = None, metrics_file = None, prometheus_file = None,
+                     checkpoint_every = 0, resume = False):
     if not log:
         logging.basicConfig(level = logging.DEBUG)
         log = logging.getLogger("process_entities_function")
     else:
         log = logging.getLogger(log.name + ".process_entities_function")
     
+    output_files = []
+    target_files = []
+    checkpoint = None
     try:
         start_time = datetime.now()
-        target_file = tempfile.NamedTemporaryFile(mode='w+t', delete=False)
+        metrics = StageMetrics("ftm_mapper", data_source = data_source)
+        TRANSFORM_COUNTERS.clear()
+        load_mapping(mapping_file)
+        if shards > 1 and not output_file:
+            raise ValueError('output_file is required for sharded output')
+        if resume and not checkpoint_every:
+            checkpoint_every = DEFAULT_CHECKPOINT_EVERY
+        if checkpoint_every:
+            # interrupted run is resumed from its on-disk index, partial output files and offset in source file
+            if not output_file or source_file == "-":
+                raise ValueError('checkpoints need output_file and source file (not stdin)')
+            checkpoint_file = output_file + '.checkpoint'
+            index_file = index_file or output_file + '.index'
+            if single_pass:
+                log.info('single pass mode is not used with checkpoints')
+                single_pass = False
+        if output_file:
+            # written directly (compressed if .gz/.zst extension), renamed to output_file only when mapping is done
+            # with shards > 1 records are split between shard files by RECORD_ID
+            output_files = [output_file] if shards == 1 else [shard_file_name(output_file, shard, shards) for shard in range(shards)]
+            if resume:
+                checkpoint = load_checkpoint(checkpoint_file, source_file, data_source, shards, output_files, index_file, log)
+            if checkpoint:
+                # records written after last checkpoint are dropped, they are mapped again
+                for file_name, size in zip(output_files, checkpoint["output_sizes"]):
+                    os.truncate(file_name + '.part', size)
+                target_files = [open_output_part(file_name, "a") for file_name in output_files]
+            else:
+                target_files = [open_output_part(file_name) for file_name in output_files]
+            target_file = target_files[0]
+        else:
+            target_file = tempfile.NamedTemporaryFile(mode='w+t', encoding='utf-8', delete=False)
         # lists of entity types used in mapper
-        thing_entity_list = ["Person", "Organization", "Company", "LegalEntity", "PublicBody"] # "Asset" - not used for now
-        interest_entity_list = ["Succession", "Directorship", "Employment", "Membership", "Representation", "UnknownLink", "Ownership"]# "ProjectParticipant", "ContractAward", "Documentation", "CourtCaseParty" - not used for now
-        intervals_entity_list = interest_entity_list + ["Identification", "Address", "Family", "Associate"]
-
-        # dicts for interval entities
-        DIRECTORSHIPS: Dict[str, List[EntityProxy]] = {}
-        EMPLOYMENTS: Dict[str, List[EntityProxy]] = {}
-        MEMBERSHIPS: Dict[str, List[EntityProxy]] = {} 
-        REPRESENTATIONS: Dict[str, List[EntityProxy]] = {}
-        UNKNOWN_LINKS: Dict[str, List[EntityProxy]] = {}
-        OWNERSHIPS: Dict[str, List[EntityProxy]] = {}
-        ADDRESSES: Dict[str, EntityProxy] = {}
-        IDENTIFICATIONS: Dict[str, List[EntityProxy]] = {}
-        FAMILIES: Dict[str, List[EntityProxy]] = {}
-        ASSOCIATIONS: Dict[str, List[EntityProxy]] = {}
+        thing_entity_list = THING_ENTITY_LIST
+        intervals_entity_list = INTERVALS_ENTITY_LIST
+
+        # dicts for interval entities (or on-disk indexes if index_file provided)
+        if index_file:
+            log.info('Using on-disk interval index: ' + index_file)
+            interval_store = SqliteIntervalStore(index_file, keep_existing = checkpoint is not None)
+            # records are stored as plain JSON arrays (orjson does not serialize NamedTuple)
+            DIRECTORSHIPS = interval_store.category("DIRECTORSHIPS", encode = tuple, decode = IntervalRecord._make)
+            EMPLOYMENTS = interval_store.category("EMPLOYMENTS", encode = tuple, decode = IntervalRecord._make)
+            MEMBERSHIPS = interval_store.category("MEMBERSHIPS", encode = tuple, decode = IntervalRecord._make)
+            REPRESENTATIONS = interval_store.category("REPRESENTATIONS", encode = tuple, decode = IntervalRecord._make)
+            UNKNOWN_LINKS = interval_store.category("UNKNOWN_LINKS", encode = tuple, decode = IntervalRecord._make)
+            OWNERSHIPS = interval_store.category("OWNERSHIPS", encode = tuple, decode = IntervalRecord._make)
+            ADDRESSES = interval_store.category("ADDRESSES", multi = False)
+            IDENTIFICATIONS = interval_store.category("IDENTIFICATIONS", encode = tuple, decode = PassportRecord._make)
+            FAMILIES = interval_store.category("FAMILIES", encode = tuple, decode = IntervalRecord._make)
+            ASSOCIATIONS = interval_store.category("ASSOCIATIONS", encode = tuple, decode = IntervalRecord._make)
+            RELATIONSHIPS = interval_store.category("RELATIONSHIPS", multi = False)
+        else:
+            interval_store = None
+            DIRECTORSHIPS: Dict[str, List[IntervalRecord]] = IntervalDict()
+            EMPLOYMENTS: Dict[str, List[IntervalRecord]] = IntervalDict()
+            MEMBERSHIPS: Dict[str, List[IntervalRecord]] = IntervalDict()
+            REPRESENTATIONS: Dict[str, List[IntervalRecord]] = IntervalDict()
+            UNKNOWN_LINKS: Dict[str, List[IntervalRecord]] = IntervalDict()
+            OWNERSHIPS: Dict[str, List[IntervalRecord]] = IntervalDict()
+            ADDRESSES: Dict[str, dict] = IntervalDict()
+            IDENTIFICATIONS: Dict[str, List[PassportRecord]] = IntervalDict()
+            FAMILIES: Dict[str, List[IntervalRecord]] = IntervalDict()
+            ASSOCIATIONS: Dict[str, List[IntervalRecord]] = IntervalDict()
+            RELATIONSHIPS: Dict[str, List[dict]] = IntervalDict()
         #SUCCESIONS: Dict[str, List[EntityProxy]] = {}
 
-        # List for unknown entities
-        OTHER_ENTITIES = []
+        # fingerprints of previous run for delta mapping
+        fingerprint_store = FingerprintStore(fingerprint_file, data_source, run = checkpoint["fingerprint_run"] if checkpoint else None) if fingerprint_file else None
+        if fingerprint_store and os.getenv('PYTHONHASHSEED') in (None, 'random'):
+            # FtM keeps property values in sets, e.g. primary name depends on hash seed
+            log.info('PYTHONHASHSEED is not fixed, unchanged records may be reported as changed')
+
+        # counts of unknown entities per schema
+        OTHER_ENTITIES: Dict[str, int] = {} if catch_unknown_entities else None
         
         log.info('Proccessing file: ' + source_file)
         log.info('Data Source: ' + data_source)
+        if source_file == "-" and not single_pass:
+            log.info('stdin can be read only once, using single pass mode')
+            single_pass = True
 
+        intervals_dicts = (DIRECTORSHIPS, EMPLOYMENTS, MEMBERSHIPS, REPRESENTATIONS, UNKNOWN_LINKS,  OWNERSHIPS, IDENTIFICATIONS, ADDRESSES, FAMILIES, ASSOCIATIONS)
+        # relationship intervals are turned into RELATIONSHIPS in index phase, so transform needs only these
+        transform_dicts = (RELATIONSHIPS, IDENTIFICATIONS, ADDRESSES)
+        transform_start_time = datetime.now()
+        if checkpoint_every:
+            if checkpoint:
+                log.info('Resuming from checkpoint: %d records written, source file offset %d' % (checkpoint["records_written"], checkpoint["input_offset"]))
+            else:
+                # index is built once, resumed runs go straight to transform
+                cache_intervals(source_file, thing_entity_list, intervals_entity_list, *intervals_dicts, log, OTHER_ENTITIES, metrics = metrics,
+                                data_source = data_source, RELATIONSHIPS = RELATIONSHIPS)
+                checkpoint = {"source_file": os.path.abspath(source_file), "data_source": data_source, "shards": shards, "input_offset": 0, "records_written": 0,
+                              "fingerprint_run": fingerprint_store.run if fingerprint_store else None}
+                target_files = save_checkpoint(checkpoint_file, checkpoint, target_files, output_files, fingerprint_store)
+            chunks = read_offset_chunks(source_file, checkpoint["input_offset"])
+            if workers > 1:
+                chunk_records = transform_entities_in_pool(chunks, data_source, thing_entity_list, transform_dicts, alias_split, workers, log,
+                                                           mapping_file = mapping_file, fingerprints = bool(fingerprint_store), tagged = True)
+            else:
+                thing_schemata = set(thing_entity_list)
+                chunk_records = ((offset, transform_lines(chunk, data_source, thing_schemata, transform_dicts, alias_split, bool(fingerprint_store))) for offset, chunk in chunks)
+            records_written = checkpoint["records_written"]
+            for offset, records in chunk_records:
+                records_written += write_records(records, target_files, shards, fingerprint_store)
+                if records_written - checkpoint["records_written"] >= checkpoint_every:
+                    checkpoint.update(input_offset = offset, records_written = records_written)
+                    target_files = save_checkpoint(checkpoint_file, checkpoint, target_files, output_files, fingerprint_store)
+            target_file = target_files[0]
+        elif workers > 1:
+            chunks = read_entity_chunks(source_file, thing_entity_list, intervals_entity_list, *intervals_dicts, log, OTHER_ENTITIES, single_pass, metrics = metrics,
+                                        data_source = data_source, RELATIONSHIPS = RELATIONSHIPS)
+            records = transform_entities_in_pool(chunks, data_source, thing_entity_list, transform_dicts, alias_split, workers, log, ordered,
+                                                 mapping_file = mapping_file, fingerprints = bool(fingerprint_store))
+        else:
+            entities = read_entities(source_file, thing_entity_list, intervals_entity_list, *intervals_dicts, log, OTHER_ENTITIES, single_pass, metrics = metrics,
+                                     data_source = data_source, RELATIONSHIPS = RELATIONSHIPS)
+            records = transform_entities(entities, data_source, transform_dicts, alias_split, fingerprints = bool(fingerprint_store))
+        if not checkpoint_every:
+            records_written = write_records(records, target_files or [target_file], shards, fingerprint_store)
+        # index phase runs inside readers (lazily for read_entities)
+        metrics.add_time("transform", (datetime.now()-transform_start_time).total_seconds() - metrics.timers.get("index", 0.0))
+        if output_file:
+            for target_file, file_name in zip(target_files, output_files):
+                target_file.close()
+                os.replace(file_name + '.part', file_name)
+            bytes_written = sum(os.path.getsize(file_name) for file_name in output_files)
+        else:
+            target_file.flush()
+            bytes_written = os.path.getsize(target_file.name)
+        metrics.inc("records_written", records_written)
+        metrics.inc("bytes_written", bytes_written)
+        for name in ("relationships", "addresses_resolved", "addresses_missing"):
+            metrics.inc(name, TRANSFORM_COUNTERS[name])
+        if fingerprint_store:
+            deleted_record_ids = fingerprint_store.pop_deleted()
+            with compressed_io.open_text(deleted_file or fingerprint_file + '.deleted', "w") as fh:
+                for record_id in deleted_record_ids:
+                    fh.write(json_codec.dumps_record({"DATA_SOURCE": data_source, "RECORD_ID": record_id}))
+                    fh.write("\n")
+            fingerprint_store.commit()
+            fingerprint_store.close()
+            log.info('Delta: %d new, %d changed, %d unchanged, %d deleted records' % (fingerprint_store.new, fingerprint_store.changed, fingerprint_store.unchanged, len(deleted_record_ids)))
+            for name, value in (("new", fingerprint_store.new), ("changed", fingerprint_store.changed), ("unchanged", fingerprint_store.unchanged), ("deleted", len(deleted_record_ids))):
+                metrics.inc("delta_records", value, status = name)
+        if interval_store:
+            interval_store.remove()
+        if checkpoint_every:
+            os.remove(checkpoint_file)
         if catch_unknown_entities:
-            catch_unk_entities(source_file, thing_entity_list, intervals_entity_list, OTHER_ENTITIES, log)
-        
-        for entity in read_entities(source_file, thing_entity_list, intervals_entity_list, 
-                                    DIRECTORSHIPS, EMPLOYMENTS, MEMBERSHIPS, REPRESENTATIONS, UNKNOWN_LINKS,  OWNERSHIPS, IDENTIFICATIONS, ADDRESSES, 
-                                    FAMILIES, ASSOCIATIONS, log):
-            record = transform(data_source, entity, DIRECTORSHIPS, EMPLOYMENTS, MEMBERSHIPS, REPRESENTATIONS, UNKNOWN_LINKS,  OWNERSHIPS, IDENTIFICATIONS, 
-                                ADDRESSES, FAMILIES, ASSOCIATIONS, alias_split)
-            target_file.write(json.dumps(record))
-            target_file.write("\n")    
+            log_unk_entities(OTHER_ENTITIES, log)
         log.info('All records processed! total time spent: ' + str(datetime.now()-start_time))
+        metrics.add_time("total", (datetime.now()-start_time).total_seconds())
+        if metrics_file:
+            metrics.write_json(metrics_file)
+        if prometheus_file:
+            metrics.write_prometheus(prometheus_file)
+        # summary for caller (e.g. map_entities_script)
+        if stats is not None:
+            stats['records_written'] = records_written
+            stats['seconds'] = (datetime.now()-start_time).total_seconds()
+            stats['output_files'] = output_files if output_file else [target_file.name]
+            stats['metrics'] = metrics.to_dict()
+        if output_file:
+            return target_files if shards > 1 else target_file
         target_file.seek(0)
         return target_file
     except Exception as err:
         log.info('Error occured!')
         log.info(' %s' % err)
+        # partial output files are not kept, unless run can be resumed from checkpoint
+        for target_file, file_name in zip(target_files, output_files):
+            target_file.close()
+            if not checkpoint and os.path.exists(file_name + '.part'):
+                os.remove(file_name + '.part')
+        if checkpoint:
+            log.info('Partial output and index are kept, run can be resumed with resume option')
         sys.exit(1)
 
 # do all stuff
 if __name__ == "__main__":
     argparser = argparse.ArgumentParser()
-    argparser.add_argument('-i', '--input_file', default=os.getenv('input_file', None), type=str, help='A FTM .json input file.')
-    argparser.add_argument('-o', '--output_file', default=os.getenv('output_file', None), type=str, help='output filename, defaults to input file name with a .json extension and \"out_\" prefix.')
+    argparser.add_argument('-i', '--input_file', default=os.getenv('input_file', None), type=str, help='A FTM .json input file ("-" for stdin, .gz and .zst files are decompressed on the fly).')
+    argparser.add_argument('-o', '--output_file', default=os.getenv('output_file', None), type=str, help='output filename, defaults to input file name with a .json extension and \"out_\" prefix (compressed if ends with .gz or .zst).')
     argparser.add_argument('-d', '--data_source', default=os.getenv('data_source'.upper(), None), type=str, help='Data Source name.')
     argparser.add_argument('-l', '--log_file', default=os.getenv('log_file', None), type=str, help='optional statistics filename.')
     argparser.add_argument('-u', '--unk_entities', default=os.getenv('unk_entities', False), type=bool, help='optional bool arg (default: False), if set to True - mapper gets stats about unknown entites.')
+    argparser.add_argument('-w', '--workers', default=os.getenv('workers', 1), type=int, help='optional number of transform worker processes (default: 1).')
+    argparser.add_argument('-uo', '--unordered', default=os.getenv('unordered', False), type=bool, help='optional bool arg (default: False), if set to True - records from transform workers are written in completion order (faster, only used with -w > 1).')
+    argparser.add_argument('-s', '--single_pass', default=os.getenv('single_pass', False), type=bool, help='optional bool arg (default: False), if set to True - input file is read only once, thing entities are spilled to local temp file (for compressed, network-mounted or stdin inputs).')
+    argparser.add_argument('-m', '--mapping_file', default=os.getenv('mapping_file', None), type=str, help='optional FtM to Senzing attributes mapping .json file (default: ftm_senzing_mapping.json).')
+    argparser.add_argument('-fp', '--fingerprint_file', default=os.getenv('fingerprint_file', None), type=str, help='optional fingerprint store filename (SQLite), if set - only new and changed records since previous run are written (delta mapping).')
+    argparser.add_argument('-dl', '--deleted_file', default=os.getenv('deleted_file', None), type=str, help='optional filename for ids of records disappeared since previous run (only with -fp), defaults to output file name with ".deleted" suffix.')
+    argparser.add_argument('-sh', '--shards', default=os.getenv('shards', 1), type=int, help='optional number of output files (default: 1), records are split between them by stable hash of RECORD_ID (<output file name>_001_of_00N.json and so on).')
+    argparser.add_argument('-mj', '--metrics_json', default=os.getenv('metrics_json', None), type=str, help='optional filename for JSON summary of mapping metrics (lines read, entities per schema, intervals cached, records and bytes written, phase durations).')
+    argparser.add_argument('-pm', '--prometheus_file', default=os.getenv('prometheus_file', None), type=str, help='optional filename for mapping metrics in Prometheus text format (e.g. for node_exporter textfile collector).')
+    argparser.add_argument('-cp', '--checkpoint_every', default=os.getenv('checkpoint_every', 0), type=int, help='optional number of records between checkpoints (default: 0 - no checkpoints), if set - interrupted run can be resumed with -rs (index is kept on disk, see -x).')
+    argparser.add_argument('-rs', '--resume', default=os.getenv('resume', False), type=bool, help='optional bool arg (default: False), if set to True - interrupted run with the same input and output files is resumed from its last checkpoint (%d records between checkpoints unless -cp set).' % DEFAULT_CHECKPOINT_EVERY)
+    argparser.add_argument('-x', '--index_file', default=os.getenv('index_file', None), type=str, help='optional on-disk interval index filename (SQLite), if set - intervals are cached on disk instead of RAM (for huge input files).')
     args = argparser.parse_args()
     input_file_name = args.input_file
     output_file_name = args.output_file
@@ -413,12 +867,14 @@ if __name__ == "__main__":
     log = logging.getLogger("ftm_mapper_script")
     
     try:
-        output = process_entities(data_source, input_file_name, log, alias_split = True, catch_unknown_entities = args.unk_entities)
-        temp_file_name = output.name
-        output.close()
-        shutil.copy(temp_file_name, output_file_name)
-        log.info('Saved as ' + output_file_name)
-        os.remove(temp_file_name)
+        output = process_entities(data_source, input_file_name, log, alias_split = True, catch_unknown_entities = args.unk_entities, index_file = args.index_file, workers = args.workers, ordered = not args.unordered, mapping_file = args.mapping_file, single_pass = args.single_pass,
+                                  fingerprint_file = args.fingerprint_file, deleted_file = args.deleted_file or (output_file_name + '.deleted' if args.fingerprint_file else None),
+                                  output_file = output_file_name, shards = args.shards, metrics_file = args.metrics_json, prometheus_file = args.prometheus_file,
+                                  checkpoint_every = args.checkpoint_every, resume = args.resume)
+        if args.shards > 1:
+            log.info('Saved as %d shards of %s' % (args.shards, output_file_name))
+        else:
+            log.info('Saved as ' + output_file_name)
         sys.exit(0)
     except Exception as err:
         log.info('Error occured!')
@@ -0,0 +1,148 @@
+import os
+import sqlite3
+import itertools
+import json_codec
+
+# in-memory interval index: entity id -> list of cached interval values
+class IntervalDict(dict):
+
+    # add one more value for key
+    def append(self, key, value):
+        values = self.get(key)
+        if values is None:
+            self[key] = [value]
+        else:
+            values.append(value)
+
+    # nothing to write for in-memory index, added for compatibility with SqliteIntervalIndex
+    def finalize(self):
+        pass
+
+    # number of cached values (one per key for single value indexes, e.g. addresses)
+    def size(self):
+        return sum(len(values) if isinstance(values, list) else 1 for values in self.values())
+
+# on-disk interval store: one SQLite file shared by all interval categories of a mapping run
+class SqliteIntervalStore:
+
+    # keep_existing - reopen store persisted by previous (interrupted) run instead of rebuilding it
+    def __init__(self, path, read_only = False, batch_size = 10000, keep_existing = False):
+        self.path = path
+        self.read_only = read_only
+        self.batch_size = batch_size
+        self._rows = []
+        self._pid = os.getpid()
+        if read_only:
+            self._connection = self._connect_read_only()
+        elif keep_existing:
+            self._connection = sqlite3.connect(path, check_same_thread = False)
+        else:
+            if os.path.exists(path):
+                os.remove(path)
+            self._connection = sqlite3.connect(path, check_same_thread = False)
+            # scratch file, rebuilt from source file on every run, so no journal needed
+            self._connection.execute('PRAGMA journal_mode = OFF')
+            self._connection.execute('PRAGMA synchronous = OFF')
+            self._connection.execute('CREATE TABLE intervals (category TEXT, key TEXT, value TEXT)')
+
+    def _connect_read_only(self):
+        return sqlite3.connect('file:' + self.path + '?mode=ro', uri = True, check_same_thread = False)
+
+    # SQLite connection can't be shared with forked worker processes, so they open their own read-only one
+    @property
+    def connection(self):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._connection = self._connect_read_only()
+        return self._connection
+
+    # get index for one interval category (multi = False for one value per key, e.g. addresses)
+    def category(self, name, multi = True, encode = None, decode = None):
+        return SqliteIntervalIndex(self, name, multi, encode, decode)
+
+    def add(self, category, key, value):
+        self._rows.append((category, key, value))
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._rows:
+            self.connection.executemany('INSERT INTO intervals VALUES (?, ?, ?)', self._rows)
+            self._rows = []
+
+    # write remaining rows and build lookup index, must be called before querying
+    def finalize(self):
+        self.flush()
+        self.connection.execute('CREATE INDEX IF NOT EXISTS intervals_key ON intervals (category, key)')
+        self.connection.commit()
+
+    def fetch(self, category, key):
+        cursor = self.connection.execute('SELECT value FROM intervals WHERE category = ? AND key = ? ORDER BY rowid', (category, key))
+        return [row[0] for row in cursor]
+
+    # (key, [(category, value), ...]) for all keys of given categories, values of each key in insertion order
+    def fetch_grouped(self, categories):
+        cursor = self.connection.execute('SELECT key, category, value FROM intervals WHERE category IN (%s) ORDER BY key, rowid' % ','.join('?' * len(categories)), categories)
+        for key, rows in itertools.groupby(cursor, key = lambda row: row[0]):
+            yield key, [(category, value) for _, category, value in rows]
+
+    def keys(self, category):
+        cursor = self.connection.execute('SELECT DISTINCT key FROM intervals WHERE category = ?', (category,))
+        return [row[0] for row in cursor]
+
+    def count(self, category):
+        return self.connection.execute('SELECT COUNT(*) FROM intervals WHERE category = ?', (category,)).fetchone()[0]
+
+    def close(self):
+        self._connection.close()
+
+    # remove store file
+    def remove(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    # store is reopened read-only by path in other processes
+    def __getstate__(self):
+        return {'path': self.path, 'batch_size': self.batch_size}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], read_only = True, batch_size = state['batch_size'])
+
+# on-disk index for one interval category, dict-like interface used by mapper
+class SqliteIntervalIndex:
+
+    def __init__(self, store, name, multi = True, encode = None, decode = None):
+        self.store = store
+        self.name = name
+        self.multi = multi
+        self.encode = encode
+        self.decode = decode
+
+    def append(self, key, value):
+        if self.encode:
+            value = self.encode(value)
+        self.store.add(self.name, key, json_codec.dumps(value))
+
+    def __setitem__(self, key, value):
+        self.append(key, value)
+
+    def get(self, key, default = None):
+        values = self.store.fetch(self.name, key)
+        if not values:
+            return default
+        if not self.multi:
+            values = values[-1:] # last written value wins, same as for dict
+        values = [json_codec.loads(value) for value in values]
+        if self.decode:
+            values = [self.decode(value) for value in values]
+        return values if self.multi else values[0]
+
+    def keys(self):
+        return self.store.keys(self.name)
+
+    def size(self):
+        return self.store.count(self.name)
+
+    def finalize(self):
+        self.store.finalize()
@@ -0,0 +1,55 @@
+import json
+import os
+import re
+
+# JSON codec shared by mapper and loader: orjson (or simdjson for decoding) is used if installed, stdlib json otherwise.
+# All backends write the same compact UTF-8 JSON, so output does not depend on installed libraries.
+# Senzing records of mapper output are written by dumps_record in json.dumps default format, as mapper always wrote them.
+# JSON_CODEC env variable ("orjson", "simdjson" or "json") forces backend, e.g. for benchmarks.
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+JSON_CODEC = os.environ.get("JSON_CODEC")
+
+def _json_dumps(obj):
+    return json.dumps(obj, ensure_ascii = False, separators = (',', ':'))
+
+def _orjson_dumps(obj):
+    return orjson.dumps(obj).decode()
+
+# ", " and ": " separators and escaped non-ASCII chars, stdlib json is used with every backend (orjson can not write this format)
+def dumps_record(obj):
+    return json.dumps(obj)
+
+if orjson and JSON_CODEC in (None, "orjson"):
+    backend = "orjson"
+    loads = orjson.loads
+    dumps = _orjson_dumps
+elif simdjson and JSON_CODEC in (None, "simdjson"):
+    backend = "simdjson"
+    loads = simdjson.loads
+    dumps = _json_dumps
+else:
+    backend = "json"
+    loads = json.loads
+    dumps = _json_dumps
+
+# mapper writes DATA_SOURCE and RECORD_ID as first keys of each record, so loader reads them from line prefix without decoding whole record
+# (NAME_LIST, RELATIONSHIP_LIST and so on), records of other layout or with escaped chars in keys are decoded as usual
+RECORD_KEYS_PREFIX = re.compile(r'\{\s*"DATA_SOURCE"\s*:\s*"([^"\\]*)"\s*,\s*"RECORD_ID"\s*:\s*"([^"\\]*)"')
+
+# (DATA_SOURCE, RECORD_ID) of senzing record line
+def record_keys(line):
+    match = RECORD_KEYS_PREFIX.match(line)
+    if match:
+        return match.group(1), match.group(2)
+    record = loads(line)
+    return record["DATA_SOURCE"], record["RECORD_ID"]
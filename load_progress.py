@@ -0,0 +1,51 @@
+import os
+import json_codec
+from metrics import write_atomic
+
+# committed positions of loaded file, kept in JSON file so interrupted load could be resumed (Senzing re-adds records idempotently)
+# position is (offset in decompressed bytes, line number) after last chunk such that all chunks before it are loaded,
+# multi-process load has one position per slice of file
+class LoadProgress:
+
+    def __init__(self, path, source_file, slices = 1):
+        self.path = path
+        self.source_file = os.path.abspath(source_file)
+        self.slices = slices
+        self.positions = [(0, 0)] * slices
+        self.lines = [0] * slices
+        self.failed = [0] * slices
+        self.saving = True
+
+    # positions of previous load of the same file, returns False if there is no such load
+    # raises ValueError if previous load had other number of slices (its positions can not be used)
+    def resume(self):
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "r", encoding="utf-8") as fh:
+            progress = json_codec.loads(fh.read())
+        if progress.get("source_file") != self.source_file:
+            return False
+        if progress.get("slices") != self.slices:
+            raise ValueError('progress of previous load in %s was saved by %s processes, not %d: resume with the same number of processes (-pr %s) '
+                             'or load from the start without resume' % (self.path, progress.get("slices"), self.slices, progress.get("slices")))
+        self.positions = [tuple(position) for position in progress["positions"]]
+        return True
+
+    # progress of slice, returns False if file can not be saved (e.g. read-only directory), then load goes on without saving
+    def update(self, slice_index, lines, failed, position = None):
+        self.lines[slice_index] = lines
+        self.failed[slice_index] = failed
+        if position is not None:
+            self.positions[slice_index] = tuple(position)
+        if position is None or not self.saving:
+            return True
+        try:
+            write_atomic(self.path, json_codec.dumps({"source_file": self.source_file, "slices": self.slices, "positions": self.positions}) + "\n")
+        except OSError:
+            self.saving = False
+        return self.saving
+
+    # load is done, nothing to resume
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -8,10 +8,23 @@ from senzing_utils import load_records_to_senzing
 if __name__ == "__main__":
     start_time = datetime.now()
     argparser = argparse.ArgumentParser()
-    argparser.add_argument('-p', '--path_to_file', default=os.getenv('path_to_file', None), type=str, help='A path to senzing .json input file.')
+    argparser.add_argument('-p', '--path_to_file', default=os.getenv('path_to_file', None), type=str, help='A path to senzing .json input file (.json.gz and .json.zst files are decompressed on the fly).')
     argparser.add_argument('-lp', '--log_file_path', default=os.getenv('log_file_path', None), type=str, help='Optional RELATIVE path to directory to store statistics filename.')
     argparser.add_argument('-l', '--log_file', default=os.getenv('log_file', None), type=str, help='Optional statistics filename.')
     argparser.add_argument('-t', '--number_of_threads', default=os.getenv('number_of_threads', 4), type=int, help='Optional number of threads.')
+    argparser.add_argument('-cs', '--chunk_size', default=os.getenv('chunk_size', 100), type=int, help='Optional number of records in work unit of loader thread (default: 100).')
+    argparser.add_argument('-pf', '--prefetch', default=os.getenv('prefetch', 2), type=int, help='Optional number of chunks read ahead per thread (default: 2).')
+    argparser.add_argument('-pr', '--processes', default=os.getenv('processes', 1), type=int, help='Optional number of loader processes, each with its own G2Engine and threads (default: 1).')
+    argparser.add_argument('-rs', '--resume', default=os.getenv('resume', False), type=bool, help='Optional bool arg (default: False), if set to True - interrupted load of the same file (with the same number of processes) is resumed from its saved progress.')
+    argparser.add_argument('-pg', '--progress_file', default=os.getenv('progress_file', None), type=str, help='Optional filename for load progress (default: input file name with ".progress" suffix), removed when file is loaded.')
+    argparser.add_argument('-dl', '--dead_letter_file', default=os.getenv('dead_letter_file', None), type=str, help='Optional filename for records failed for good, with error reason (default: input file name with ".dead_letter.json" suffix), could be loaded again with replay_dead_letters.py.')
+    argparser.add_argument('-ra', '--retry_attempts', default=os.getenv('retry_attempts', 5), type=int, help='Optional number of attempts for records failed with retryable errors (DB deadlocks, lost connections, config changes), with growing pauses between them (default: 5).')
+    argparser.add_argument('-cf', '--config_poll_seconds', default=os.getenv('config_poll_seconds', 10), type=float, help='Optional seconds between checks of default Senzing config, G2Engine is reinitialised when it changes (default: 10).')
+    argparser.add_argument('-mj', '--metrics_json', default=os.getenv('metrics_json', None), type=str, help='Optional filename for JSON summary of loader metrics, rewritten every metrics interval and at the end.')
+    argparser.add_argument('-pm', '--prometheus_file', default=os.getenv('prometheus_file', None), type=str, help='Optional filename for loader metrics in Prometheus text format (e.g. for node_exporter textfile collector), rewritten every metrics interval.')
+    argparser.add_argument('-mp', '--metrics_port', default=os.getenv('metrics_port', None), type=int, help='Optional local port for Prometheus endpoint (http://127.0.0.1:<port>/metrics) of loader metrics.')
+    argparser.add_argument('-mi', '--metrics_interval', default=os.getenv('metrics_interval', 15), type=float, help='Optional seconds between writes of metrics files (default: 15).')
+    argparser.add_argument('-if', '--info_file', default=os.getenv('info_file', None), type=str, help='Optional NDJSON filename ("-" for stdout) for entities affected by loaded records (withInfo mode: Senzing response of each record with AFFECTED_ENTITIES is appended), so only these entities could be refreshed downstream.')
     argparser.add_argument('-i', '--init_json', default=os.getenv('init_json', 'senzing_init_settings.json'), type=str, help='Name of .json file wich contains senzing paths and SQL connections (if not specified, default will be used).')
     args = argparser.parse_args()
     path_to_file = args.path_to_file
@@ -47,8 +60,13 @@ if __name__ == "__main__":
     
     log = logging.getLogger("load_records_script")
     
+    metrics_exports = None
+    if args.metrics_json or args.prometheus_file or args.metrics_port:
+        metrics_exports = {"json_file": args.metrics_json, "prometheus_file": args.prometheus_file, "port": args.metrics_port, "interval": args.metrics_interval}
+
     try:
-        load_records_to_senzing(path_to_file, init_json, log, number_of_threads)
+        load_records_to_senzing(path_to_file, init_json, log, number_of_threads, args.chunk_size, args.prefetch, args.processes, args.resume, args.progress_file, args.dead_letter_file,
+                                metrics_exports, config_poll_seconds = args.config_poll_seconds, retry_attempts = args.retry_attempts, info_file = args.info_file)
         log.info('Success. Time spent: ' + str(datetime.now()-start_time))
         sys.exit(0)
 
@@ -3,10 +3,116 @@ import os
 import argparse
 import sys
 from datetime import datetime
-import shutil
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
 from ftm_mapper import process_entities
+import compressed_io
 
-def map_entites(source_files_list, data_sources_list, out_path, log = None):
+# rough memory estimate for mapping one file: interval dicts grow with input size, compressed files are ~5x smaller than their content
+BASE_MEMORY_MB = 100
+COMPRESSION_RATIO = 5
+
+def estimate_memory_mb(input_file_name):
+    size = os.path.getsize(input_file_name)
+    if compressed_io.is_compressed(input_file_name):
+        size *= COMPRESSION_RATIO
+    return BASE_MEMORY_MB + size / 2**20
+
+# map one input file, returns summary of file (used both in-process and in pool worker)
+def map_file(input_file_name, data_source, out_path, log_name, fingerprints_path = None, shards = 1, metrics_path = None):
+    log = logging.getLogger(log_name)
+    summary = {"file": input_file_name, "data_source": data_source, "ok": False, "records": 0, "output_files": [], "error": None}
+    start_time = datetime.now()
+    log.info('Processing file ' + input_file_name)
+    try:
+        fingerprint_file = None
+        deleted_file = None
+        if fingerprints_path:
+            # one fingerprint store per input file, only new and changed records are written
+            fingerprint_file = fingerprints_path + os.path.basename(input_file_name) + '.fingerprints.sqlite'
+            deleted_file = out_path + 'deleted_' + os.path.basename(input_file_name)
+        # output keeps input file extension, so .gz/.zst inputs give compressed outputs
+        output_file_name = 'out_' + os.path.basename(input_file_name)
+        metrics_file = None
+        prometheus_file = None
+        if metrics_path:
+            metrics_file = metrics_path + 'metrics_' + os.path.basename(input_file_name) + '.json'
+            prometheus_file = metrics_path + 'ftm_mapper_' + os.path.basename(input_file_name).replace('.', '_') + '.prom'
+        stats = {}
+        process_entities(data_source, input_file_name, log,
+                         fingerprint_file = fingerprint_file, deleted_file = deleted_file, output_file = out_path + output_file_name, shards = shards, stats = stats,
+                         metrics_file = metrics_file, prometheus_file = prometheus_file)
+        log.info('Saved as ' + out_path + output_file_name)
+        summary.update(ok = True, records = stats['records_written'], output_files = stats['output_files'])
+    # process_entities exits on errors, so SystemExit is caught too, to keep other files going
+    except (Exception, SystemExit) as err:
+        log.info(' %s' % err)
+        summary["error"] = 'mapping failed, see log above' if isinstance(err, SystemExit) else str(err)
+    summary["seconds"] = (datetime.now()-start_time).total_seconds()
+    return summary
+
+# summary of file which failed outside of map_file (worker process died, result not returned)
+def failed_summary(task, start_time, error):
+    return {"file": task[0], "data_source": task[1], "ok": False, "records": 0, "output_files": [], "error": error,
+            "seconds": (datetime.now()-start_time).total_seconds()}
+
+# map files in process pool, several files at once within jobs and memory budget (biggest files start first)
+# if worker process dies (e.g. killed by OOM killer) pool is broken: it is recreated and files running at that moment are mapped again one at a time,
+# file which breaks pool while running alone is failed
+def map_files_in_pool(tasks, out_path, log, fingerprints_path, shards, jobs, memory_budget, metrics_path = None):
+    pending = sorted(tasks, key = lambda task: task[2], reverse = True) # (input file, data source, estimated memory)
+    summaries = []
+    running = {} # future -> (task, start time)
+    suspects = set() # files running when pool was broken
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers = jobs)
+    try:
+        while pending or running:
+            for task in list(pending):
+                if len(running) >= jobs or any(running_task[0] in suspects for running_task, _ in running.values()):
+                    break
+                # at least one file is always running, even if it doesn't fit into budget
+                if running and (task[0] in suspects or memory_budget and sum(running_task[2] for running_task, _ in running.values()) + task[2] > memory_budget):
+                    continue
+                pending.remove(task)
+                future = executor.submit(map_file, task[0], task[1], out_path, log.name, fingerprints_path, shards, metrics_path)
+                running[future] = (task, datetime.now())
+            done, _ = concurrent.futures.wait(running, return_when = concurrent.futures.FIRST_COMPLETED)
+            if any(isinstance(future.exception(), BrokenProcessPool) for future in done):
+                # all running files fail with broken pool, new pool is used for the rest
+                done, _ = concurrent.futures.wait(running)
+                executor.shutdown(wait = False)
+                executor = concurrent.futures.ProcessPoolExecutor(max_workers = jobs)
+            broken = [future for future in done if isinstance(future.exception(), BrokenProcessPool)]
+            for future in done:
+                task, start_time = running.pop(future)
+                try:
+                    summaries.append(future.result())
+                except BrokenProcessPool as err:
+                    if len(broken) > 1 and task[0] not in suspects:
+                        log.info(' %s: worker process died while %d files were mapped, file is mapped again alone' % (task[0], len(broken)))
+                        suspects.add(task[0])
+                        pending.append(task)
+                    else:
+                        log.info(' %s: worker process died: %s' % (task[0], err))
+                        summaries.append(failed_summary(task, start_time, 'worker process died: %s' % err))
+                except Exception as err:
+                    log.info(' %s: %s' % (task[0], err))
+                    summaries.append(failed_summary(task, start_time, str(err)))
+    finally:
+        executor.shutdown()
+    return summaries
+
+def log_summary(summaries, log):
+    log.info('Files summary:')
+    for summary in summaries:
+        if summary["ok"]:
+            log.info(' %s (%s): %d records, %.1f s' % (summary["file"], summary["data_source"], summary["records"], summary["seconds"]))
+        else:
+            log.info(' %s (%s): FAILED after %.1f s: %s' % (summary["file"], summary["data_source"], summary["seconds"], summary["error"]))
+    failed = sum(1 for summary in summaries if not summary["ok"])
+    log.info('Total: %d files (%d failed), %d records' % (len(summaries), failed, sum(summary["records"] for summary in summaries)))
+
+def map_entites(source_files_list, data_sources_list, out_path, log = None, fingerprints_path = None, shards = 1, jobs = 1, memory_budget = None, metrics_path = None):
     # init logging if no logger provided
     if not log:
         logging.basicConfig(level = logging.DEBUG)
@@ -17,19 +123,17 @@ def map_entites(source_files_list, data_sources_list, out_path, log = None):
     output_paths_list = []
     
     try:
-        for i, input_file_name in enumerate(source_files_list):
-            log.info('Processing file ' + input_file_name)
-            try:
-                output = process_entities(data_sources_list[i], input_file_name, log)
-                temp_file_name = output.name
-                output.close()
-                output_file_name = 'out_' + os.path.basename(input_file_name)
-                shutil.copy(temp_file_name, out_path + output_file_name)
-                log.info('Saved as ' + out_path + output_file_name)
-                os.remove(temp_file_name)
-                output_paths_list.append(out_path + output_file_name)
-            except Exception as err:
-                log.info(' %s' % err)
+        if jobs > 1:
+            tasks = [(input_file_name, data_sources_list[i], estimate_memory_mb(input_file_name)) for i, input_file_name in enumerate(source_files_list)]
+            log.info('Mapping %d files with %d jobs' % (len(tasks), jobs) + (', memory budget %d MB' % memory_budget if memory_budget else ''))
+            summaries = map_files_in_pool(tasks, out_path, log, fingerprints_path, shards, jobs, memory_budget, metrics_path)
+        else:
+            summaries = [map_file(input_file_name, data_sources_list[i], out_path, log.name, fingerprints_path, shards, metrics_path) for i, input_file_name in enumerate(source_files_list)]
+        # output paths in input files order
+        summaries.sort(key = lambda summary: source_files_list.index(summary["file"]))
+        for summary in summaries:
+            output_paths_list.extend(summary["output_files"])
+        log_summary(summaries, log)
         return output_paths_list
     
     except Exception as err:
@@ -39,10 +143,15 @@ def map_entites(source_files_list, data_sources_list, out_path, log = None):
 if __name__ == "__main__":
     start_time = datetime.now()
     argparser = argparse.ArgumentParser()
-    argparser.add_argument('-f','--files_list',nargs='+', default=os.getenv('files_list', None), type=str, help='List of FULL paths to input FtM .json files (use this OR -p arg!).')
+    argparser.add_argument('-f','--files_list',nargs='+', default=os.getenv('files_list', None), type=str, help='List of FULL paths to input FtM .json files, .json.gz and .json.zst files are decompressed on the fly (use this OR -p arg!).')
     argparser.add_argument('-p', '--path_to_files', default=os.getenv('path_to_files', None), type=str, help='A FULL path to directory containing FtM .json input files (use this OR -f arg!).')
     argparser.add_argument('-d','--data_sources',nargs='+', default=os.getenv('data_sources', None), type=str, help='Data source names list (you must provide one data source name for each input .json file!).')
     argparser.add_argument('-o', '--out_path', default=os.getenv('out_path', None), type=str, help='Output RELATIVE path for senzing .json files to be stored in.')
+    argparser.add_argument('-fp', '--fingerprints_path', default=os.getenv('fingerprints_path', None), type=str, help='optional RELATIVE path to directory with fingerprint stores of previous run, if set - only new and changed records are written (delta mapping), ids of disappeared records are stored as deleted_<input file name>.')
+    argparser.add_argument('-sh', '--shards', default=os.getenv('shards', 1), type=int, help='optional number of output files per input file (default: 1), records are split between them by stable hash of RECORD_ID.')
+    argparser.add_argument('-j', '--jobs', default=os.getenv('jobs', 1), type=int, help='optional number of files mapped at once in separate processes (default: 1).')
+    argparser.add_argument('-mb', '--memory_budget', default=os.getenv('memory_budget', None), type=int, help='optional memory budget in MB for files mapped at once (only with -j > 1), next file starts only if estimated memory of running files fits into budget.')
+    argparser.add_argument('-md', '--metrics_path', default=os.getenv('metrics_path', None), type=str, help='optional RELATIVE path to directory for mapping metrics of each file (metrics_<input file name>.json and ftm_mapper_<input file name>.prom).')
     argparser.add_argument('-lp', '--log_file_path', default=os.getenv('log_file_path', None), type=str, help='optional RELATIVE path to directory to store statistics filename.')
     argparser.add_argument('-l', '--log_file', default=os.getenv('log_file', None), type=str, help='Optional statistics filename.')
     args = argparser.parse_args()
@@ -52,6 +161,11 @@ if __name__ == "__main__":
     out_path = args.out_path
     log_file_path = args.log_file_path
     log_file = args.log_file
+    fingerprints_path = args.fingerprints_path
+    shards = args.shards
+    jobs = args.jobs
+    memory_budget = args.memory_budget
+    metrics_path = args.metrics_path
 
     if (not files_list) and (not path_to_files):
         print('')
@@ -109,6 +223,28 @@ if __name__ == "__main__":
             print('')
             sys.exit(1)            
 
+    if fingerprints_path:
+        if not os.path.isdir(os.getcwd() + fingerprints_path):
+            try:
+                os.mkdir(os.getcwd() + fingerprints_path)
+            except:
+                print('')
+                print('Incorrect fingerprints directory path. Please provide correct path to fingerprints directory instead.')
+                print('')
+                sys.exit(1)
+        fingerprints_path = os.getcwd() + fingerprints_path
+
+    if metrics_path:
+        if not os.path.isdir(os.getcwd() + metrics_path):
+            try:
+                os.mkdir(os.getcwd() + metrics_path)
+            except:
+                print('')
+                print('Incorrect metrics directory path. Please provide correct path to metrics directory instead.')
+                print('')
+                sys.exit(1)
+        metrics_path = os.getcwd() + metrics_path
+
     if log_file:
         if log_file_path:
             if os.path.isdir(os.getcwd() + log_file_path):
@@ -132,7 +268,7 @@ if __name__ == "__main__":
     log = logging.getLogger("map_entities_script")
         
     try:
-        map_entites(files_list, data_sources, os.getcwd() + out_path, log)
+        map_entites(files_list, data_sources, os.getcwd() + out_path, log, fingerprints_path, shards, jobs, memory_budget, metrics_path)
         log.info('All files processed. Time spent: ' + str(datetime.now()-start_time))
         sys.exit(0)
 
@@ -0,0 +1,247 @@
+import os
+import time
+import bisect
+import threading
+import http.server
+from contextlib import contextmanager
+import json_codec
+
+# upper bounds (seconds) of latency histogram buckets, Senzing calls take from about a millisecond to seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# windows (seconds) of sliding rates
+RATE_WINDOWS = (10, 60)
+
+# histogram of observed values (e.g. call latencies), counts per bucket are not cumulative here, as in Prometheus export
+class Histogram:
+
+    def __init__(self, buckets = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    # (upper bound, count of values <= bound) pairs
+    def cumulative(self):
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def to_dict(self):
+        return {"count": self.count, "sum": self.sum, "buckets": {prometheus_bound(bound): count for bound, count in self.cumulative()}}
+
+# events per second over sliding windows, events are counted in one second slots
+class RateWindow:
+
+    def __init__(self, seconds = max(RATE_WINDOWS)):
+        self.slots = [0] * (seconds + 1) # current second is not complete, rate is counted by full seconds before it
+        self.slot_seconds = [0] * (seconds + 1)
+
+    def add(self, count = 1):
+        second = int(time.monotonic())
+        index = second % len(self.slots)
+        if self.slot_seconds[index] != second:
+            self.slot_seconds[index] = second
+            self.slots[index] = 0
+        self.slots[index] += count
+
+    def rate(self, seconds):
+        second = int(time.monotonic())
+        return sum(count for slot_second, count in zip(self.slot_seconds, self.slots) if second - seconds <= slot_second < second) / seconds
+
+# counters and stage timers of one run, exported as JSON summary and/or Prometheus textfile (for node_exporter textfile collector)
+class StageMetrics:
+
+    def __init__(self, prefix, **labels):
+        self.prefix = prefix
+        self.labels = labels # common labels of all metrics, e.g. data_source
+        self.counters = {} # (name, labels) -> value
+        self.timers = {} # stage -> seconds
+        self.histograms = {} # (name, labels) -> Histogram
+        self.rates = {} # name -> RateWindow
+        self.lock = threading.Lock() # metrics could be updated by many threads (e.g. loader)
+
+    def inc(self, name, value = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.counters[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    # count events for sliding rates (<name>_per_second)
+    def mark(self, name, count = 1):
+        with self.lock:
+            rate = self.rates.get(name)
+            if rate is None:
+                rate = self.rates[name] = RateWindow()
+            rate.add(count)
+
+    def add_time(self, stage, seconds):
+        self.timers[stage] = self.timers.get(stage, 0.0) + seconds
+
+    # with metrics.timer("index"): ...
+    @contextmanager
+    def timer(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - started)
+
+    # counters without labels as values, counters with labels as dicts of "label=value,..." -> value (histograms the same way)
+    def to_dict(self):
+        with self.lock:
+            counters = {}
+            for (name, labels), value in sorted(self.counters.items()):
+                if labels:
+                    counters.setdefault(name, {})[','.join('%s=%s' % label for label in labels)] = value
+                else:
+                    counters[name] = value
+            result = {"labels": self.labels, "counters": counters, "stage_seconds": dict(self.timers)}
+            if self.histograms:
+                histograms = result["histograms"] = {}
+                for (name, labels), histogram in sorted(self.histograms.items()):
+                    if labels:
+                        histograms.setdefault(name, {})[','.join('%s=%s' % label for label in labels)] = histogram.to_dict()
+                    else:
+                        histograms[name] = histogram.to_dict()
+            if self.rates:
+                result["rates_per_second"] = {name: {"%ds" % window: rate.rate(window) for window in RATE_WINDOWS} for name, rate in sorted(self.rates.items())}
+            return result
+
+    def write_json(self, filename):
+        write_atomic(filename, json_codec.dumps(self.to_dict()) + "\n")
+
+    def to_prometheus(self):
+        with self.lock:
+            return self._to_prometheus()
+
+    def _to_prometheus(self):
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(self.counters.items()):
+            metric = self.prefix + '_' + name
+            if metric not in typed:
+                lines.append('# TYPE %s gauge' % metric) # values of one run, not monotonic between runs
+                typed.add(metric)
+            lines.append('%s%s %s' % (metric, prometheus_labels(self.labels, dict(labels)), value))
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            metric = self.prefix + '_' + name
+            if metric not in typed:
+                lines.append('# TYPE %s histogram' % metric)
+                typed.add(metric)
+            for bound, count in histogram.cumulative():
+                lines.append('%s_bucket%s %d' % (metric, prometheus_labels(self.labels, dict(labels), {"le": prometheus_bound(bound)}), count))
+            lines.append('%s_sum%s %.6f' % (metric, prometheus_labels(self.labels, dict(labels)), histogram.sum))
+            lines.append('%s_count%s %d' % (metric, prometheus_labels(self.labels, dict(labels)), histogram.count))
+        for name, rate in sorted(self.rates.items()):
+            metric = self.prefix + '_' + name + '_per_second'
+            lines.append('# TYPE %s gauge' % metric)
+            for window in RATE_WINDOWS:
+                lines.append('%s%s %.3f' % (metric, prometheus_labels(self.labels, {"window": "%ds" % window}), rate.rate(window)))
+        metric = self.prefix + '_stage_seconds'
+        if self.timers:
+            lines.append('# TYPE %s gauge' % metric)
+        for stage, seconds in sorted(self.timers.items()):
+            lines.append('%s%s %.6f' % (metric, prometheus_labels(self.labels, {"stage": stage}), seconds))
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, filename):
+        write_atomic(filename, self.to_prometheus())
+
+def prometheus_bound(bound):
+    return '+Inf' if bound == float("inf") else '%g' % bound
+
+def prometheus_labels(*label_dicts):
+    labels = {}
+    for label_dict in label_dicts:
+        labels.update(label_dict)
+    if not labels:
+        return ''
+    return '{' + ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for name, value in labels.items()) + '}'
+
+# textfile collectors may read file at any moment, so it is written to temp file and renamed
+def write_atomic(filename, text):
+    with open(filename + '.tmp', "w", encoding="utf-8") as fh:
+        fh.write(text)
+    os.replace(filename + '.tmp', filename)
+
+# default seconds between exports of MetricsExporter
+EXPORT_INTERVAL_SECONDS = 15
+
+# exports metrics of long running process (loader, redo): JSON summary and Prometheus textfile are rewritten every interval seconds
+# (and when exporter is stopped), Prometheus endpoint (GET /metrics) is served on local port
+class MetricsExporter:
+
+    def __init__(self, metrics, json_file = None, prometheus_file = None, port = None, interval = EXPORT_INTERVAL_SECONDS):
+        self.metrics = metrics
+        self.json_file = json_file
+        self.prometheus_file = prometheus_file
+        self.port = port
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.server = None
+
+    def start(self):
+        if self.port:
+            metrics = self.metrics
+
+            class MetricsHandler(http.server.BaseHTTPRequestHandler):
+
+                def do_GET(self):
+                    if self.path.split('?')[0] not in ('/', '/metrics'):
+                        self.send_error(404)
+                        return
+                    body = metrics.to_prometheus().encode()
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass # scrapes are not logged
+
+            self.server = http.server.ThreadingHTTPServer(("127.0.0.1", self.port), MetricsHandler)
+            self.server.daemon_threads = True
+            threading.Thread(target = self.server.serve_forever, daemon = True).start()
+        if self.json_file or self.prometheus_file:
+            self.thread.start()
+        return self
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.export()
+
+    def export(self):
+        if self.json_file:
+            self.metrics.write_json(self.json_file)
+        if self.prometheus_file:
+            self.metrics.write_prometheus(self.prometheus_file)
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self.export()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
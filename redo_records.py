@@ -11,6 +11,12 @@ if __name__ == "__main__":
     argparser.add_argument('-lp', '--log_file_path', default=os.getenv('log_file_path', None), type=str, help='Optional RELATIVE path to directory to store statistics filename.')
     argparser.add_argument('-l', '--log_file', default=os.getenv('log_file', None), type=str, help='Optional statistics filename.')
     argparser.add_argument('-t', '--number_of_threads', default=os.getenv('number_of_threads', 4), type=int, help='Optional number of threads.')
+    argparser.add_argument('-cf', '--config_poll_seconds', default=os.getenv('config_poll_seconds', 10), type=float, help='Optional seconds between checks of default Senzing config, G2Engine is reinitialised when it changes (default: 10).')
+    argparser.add_argument('-mj', '--metrics_json', default=os.getenv('metrics_json', None), type=str, help='Optional filename for JSON summary of redo metrics, rewritten every metrics interval and at the end.')
+    argparser.add_argument('-pm', '--prometheus_file', default=os.getenv('prometheus_file', None), type=str, help='Optional filename for redo metrics in Prometheus text format (e.g. for node_exporter textfile collector), rewritten every metrics interval.')
+    argparser.add_argument('-mp', '--metrics_port', default=os.getenv('metrics_port', None), type=int, help='Optional local port for Prometheus endpoint (http://127.0.0.1:<port>/metrics) of redo metrics.')
+    argparser.add_argument('-mi', '--metrics_interval', default=os.getenv('metrics_interval', 15), type=float, help='Optional seconds between writes of metrics files (default: 15).')
+    argparser.add_argument('-if', '--info_file', default=os.getenv('info_file', None), type=str, help='Optional NDJSON filename ("-" for stdout) for entities affected by redone records (withInfo mode: Senzing response of each record with AFFECTED_ENTITIES is appended), so only these entities could be refreshed downstream.')
     argparser.add_argument('-i', '--init_json', default=os.getenv('init_json', 'senzing_init_settings.json'), type=str, help='Name of .json file wich contains senzing paths and SQL connections (if not specified, default will be used).')
     args = argparser.parse_args()
     log_file_path = args.log_file_path
@@ -39,8 +45,12 @@ if __name__ == "__main__":
     
     log = logging.getLogger("redo_records_script")
         
+    metrics_exports = None
+    if args.metrics_json or args.prometheus_file or args.metrics_port:
+        metrics_exports = {"json_file": args.metrics_json, "prometheus_file": args.prometheus_file, "port": args.metrics_port, "interval": args.metrics_interval}
+
     try:
-        process_redo_records(init_json, log, number_of_threads)
+        process_redo_records(init_json, log, number_of_threads, args.config_poll_seconds, metrics_exports, args.info_file)
         
     except Exception as err:
         log.info('Error occured! Time spent: ' + str(datetime.now()-start_time))
@@ -3,9 +3,26 @@ import os
 import sys
 import time
 import logging
+from datetime import datetime
 import itertools
+import heapq
+import random
+import functools
+import queue
+import threading
+import multiprocessing
 import concurrent.futures
-from senzing import G2Exception, G2Engine, G2ConfigMgr, G2Config
+try:
+    from senzing import G2Exception, G2Engine, G2ConfigMgr, G2Config
+    from senzing import G2BadInputException, G2MissingConfigurationException, G2MissingDataSourceException, G2RetryableException, G2UnrecoverableException
+except ImportError: # senzing package is not needed with fake engine (FAKE_SENZING in init settings)
+    from fake_senzing import G2Exception, G2BadInputException, G2MissingConfigurationException, G2MissingDataSourceException, G2RetryableException, G2UnrecoverableException
+    G2Engine = G2ConfigMgr = G2Config = None
+import fake_senzing
+import json_codec
+import compressed_io
+from load_progress import LoadProgress
+from metrics import StageMetrics, MetricsExporter
 
 # load init json data (paths and SQL connections) from file
 def load_senzing_path_and_connections(senzing_init_settings_filename, log):
@@ -31,6 +48,14 @@ def init_vars(json_init_data, log):
     module_name = json_init_data['module_name']        
     global verbose_logging
     verbose_logging = False
+    # fake in-process engine instead of Senzing (see fake_senzing.py)
+    global G2Engine, G2ConfigMgr, G2Config
+    if json_init_data.get('FAKE_SENZING') is not None:
+        G2Engine, G2ConfigMgr, G2Config = fake_senzing.configure(json_init_data['FAKE_SENZING'])
+        log.info('Fake Senzing engine is used (FAKE_SENZING in init settings), records are not loaded to Senzing')
+    elif G2Engine is None:
+        log.info('senzing package is not installed, set FAKE_SENZING in init settings to run without Senzing')
+        sys.exit(1)
     # sys path
     global python_path 
     python_path = "{0}/python".format(
@@ -325,9 +350,9 @@ def add_new_data_sources_to_config(source_files_list, senzing_init_settings_file
         log.info('Loading data source names from filenames list')
         for filename in source_files_list:
             try:
-                with open(filename, "r") as fh:
+                with compressed_io.open_text(filename, "r") as fh:
                     log.info('Processing ' + filename)
-                    data_source_list.append(json.loads(fh.readline())["DATA_SOURCE"])
+                    data_source_list.append(json_codec.loads(fh.readline())["DATA_SOURCE"])
             except Exception as err:
                 log.info(' %s' % err)
         
@@ -355,65 +380,482 @@ def add_new_data_sources_to_config(source_files_list, senzing_init_settings_file
         log.info(' %s' % err)
         sys.exit(1)
 
-# load 1 line function
-def load_line(line, engine, config_engine, log, unprocessed_lines_file = None):
+# default seconds between polls of default config ID by ConfigWatcher, and minimal seconds between polls requested by failed records
+CONFIG_POLL_SECONDS = 10
+CONFIG_MIN_POLL_SECONDS = 1
 
-    log = logging.getLogger(log.name + '.load_line_function')
-    try:    
-        data_as_json = json.loads(line)
-        engine.addRecord(
-                data_as_json["DATA_SOURCE"],
-                data_as_json["RECORD_ID"],
-                line)
-    
-            
+# background thread which polls default config ID and caches it, when default config changes G2Engine is reinitialised once
+# while engine calls of loader/redo threads are paused (they go through engine_call()), so failed records don't look up configs
+class ConfigWatcher:
+
+    def __init__(self, engine, config_engine, log, poll_seconds = CONFIG_POLL_SECONDS):
+        self.engine = engine
+        self.config_engine = config_engine
+        self.log = logging.getLogger(log.name + '.config_watcher')
+        self.poll_seconds = poll_seconds
+        # each thread has its own lock held during engine call (cheap when not contended), watcher takes all of them for reinit
+        self.local = threading.local()
+        self.thread_locks = []
+        self.thread_locks_lock = threading.Lock()
+        self.generation = 0 # number of reinits, failed call is tried again if engine was reinitialised during it
+        self.poll_requested = threading.Event()
+        self.stopped = threading.Event()
+        self.active_config_id = bytearray()
+        self.engine.getActiveConfigID(self.active_config_id)
+        self.default_config_id = self.active_config_id
+        self.thread = threading.Thread(target = self.run, daemon = True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.poll_requested.set()
+        self.thread.join()
+
+    # ask for poll before interval is over (e.g. after failed record), requests of many threads end up in one poll
+    def request_poll(self):
+        self.poll_requested.set()
+
+    # with config_watcher.engine_call(): engine.addRecord(...)
+    def engine_call(self):
+        return self
+
+    def __enter__(self):
+        lock = getattr(self.local, "lock", None)
+        if lock is None:
+            lock = self.local.lock = threading.Lock()
+            with self.thread_locks_lock:
+                self.thread_locks.append(lock)
+        lock.acquire()
+
+    def __exit__(self, *exc_info):
+        self.local.lock.release()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.poll_requested.wait(self.poll_seconds)
+            if self.stopped.is_set():
+                return
+            self.poll_requested.clear()
+            try:
+                self.poll()
+            except Exception as err:
+                self.log.info('Default config ID can not be polled')
+                self.log.info(' %s' % err)
+            self.stopped.wait(CONFIG_MIN_POLL_SECONDS)
+
+    def poll(self):
+        default_config_id = bytearray()
+        self.config_engine.getDefaultConfigID(default_config_id)
+        self.default_config_id = default_config_id
+        if default_config_id == self.active_config_id:
+            return
+        # running engine calls are finished before reinit, new ones wait for it
+        with self.thread_locks_lock:
+            for lock in self.thread_locks:
+                lock.acquire()
+            try:
+                self.engine.reinit(default_config_id)
+                self.active_config_id = default_config_id
+                self.generation += 1
+                self.log.info('G2Engine reinitialised with config ID ' + default_config_id.decode())
+            finally:
+                for lock in self.thread_locks:
+                    lock.release()
+
+# parts of messages of generic G2Exception which mean that call could succeed later (DB deadlocks, lost connections and so on)
+RETRYABLE_ERROR_MARKERS = ("deadlock", "connection", "timeout", "timed out", "try again", "temporarily", "too many clients")
+
+# class of error of failed engine call: "retryable" (DB hiccups), "config" (engine config doesn't know data source yet),
+# "bad_input" (record itself is wrong), "unrecoverable" or "error" (other errors)
+def classify_error(err):
+    if isinstance(err, (G2MissingDataSourceException, G2MissingConfigurationException)):
+        return "config"
+    if isinstance(err, (G2BadInputException, ValueError, KeyError)): # invalid JSON or record without keys
+        return "bad_input"
+    if isinstance(err, G2RetryableException):
+        return "retryable"
+    if isinstance(err, G2UnrecoverableException):
+        return "unrecoverable"
+    message = str(err).lower()
+    if any(marker in message for marker in RETRYABLE_ERROR_MARKERS):
+        return "retryable"
+    return "error"
+
+RETRYABLE_ERROR_CLASSES = ("retryable", "config")
+
+# add 1 record, with info_sink (InfoSink) record is added with addRecordWithInfo and entities affected by it are written to sink
+def add_record(data_source, record_id, line, engine, config_watcher, info_sink = None):
+    if info_sink is None:
+        with config_watcher.engine_call():
+            engine.addRecord(
+                    data_source,
+                    record_id,
+                    line)
+        return
+    response_bytearray = bytearray()
+    with config_watcher.engine_call():
+        engine.addRecordWithInfo(
+                data_source,
+                record_id,
+                line,
+                response_bytearray)
+    info_sink.write(response_bytearray)
+
+# load 1 line function, returns None if line is loaded, error otherwise
+def load_line(line, engine, config_watcher, info_sink = None):
+
+    generation = config_watcher.generation
+    try:
+        data_source, record_id = json_codec.record_keys(line)
     except Exception as err:
-        active_config_id_bytearray = bytearray()
-        default_config_id_bytearray = bytearray()
-        engine.getActiveConfigID(active_config_id_bytearray)
-        config_engine.getDefaultConfigID(default_config_id_bytearray)
+        return err # line without keys is not sent to engine, so there is nothing to retry
+
+    try:
+        add_record(data_source, record_id, line, engine, config_watcher, info_sink)
+        return None
+
+    except Exception as err:
+        # engine was reinitialised with new config while record was loaded
+        if config_watcher.generation != generation:
+            try:
+                add_record(data_source, record_id, line, engine, config_watcher, info_sink)
+                return None
+            except Exception as retry_err:
+                err = retry_err
+        if classify_error(err) in RETRYABLE_ERROR_CLASSES:
+            config_watcher.request_poll()
+        return err
+
+# default number of tries of failed record with retryable error and backoff between them (doubled after each try, up to max)
+RETRY_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 1.0
+RETRY_MAX_SECONDS = 60.0
+
+# retries of failed records with exponential backoff (and jitter, so records failed together are not retried together),
+# due retries are put into work queue of loader threads by own thread, so loader threads never sleep
+class RetryScheduler:
+
+    def __init__(self, work_queue, base_seconds = RETRY_BASE_SECONDS, max_seconds = RETRY_MAX_SECONDS):
+        self.work_queue = work_queue
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self.retries = [] # heap of (due time, sequence number, work item)
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = threading.Thread(target = self.run, daemon = True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.thread.join()
+
+    # schedule attempt-th retry (from 1) of work item
+    def schedule(self, item, attempt):
+        delay = min(self.max_seconds, self.base_seconds * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+        with self.condition:
+            heapq.heappush(self.retries, (time.monotonic() + delay, next(self.sequence), item))
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.stopped and (not self.retries or self.retries[0][0] > time.monotonic()):
+                    self.condition.wait(self.retries[0][0] - time.monotonic() if self.retries else None)
+                if self.stopped:
+                    return
+                _, _, item = heapq.heappop(self.retries)
+            self.work_queue.put(item)
+
+# NDJSON file of records failed for good (bad input, unrecoverable errors or out of retries) with error reason, for replay_dead_letters.py
+# file is created on first failed record, each entry is written by single append, so processes of one load could share the file
+class DeadLetterSink:
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def write(self, line, error_class, err, attempts):
         try:
-            if  active_config_id_bytearray != default_config_id_bytearray:
-                engine.reinit(default_config_id_bytearray)
-                log.info('G2Engine reinitialised')
-                data_as_json = json.loads(line)
-                try:
-                    engine.addRecord(
-                    data_as_json["DATA_SOURCE"],
-                    data_as_json["RECORD_ID"],
-                    line)
-                except Exception as err:
-                    log.info(' Error, line recording failed ' + line)
-                    log.info(' %s' % err)
-                    if unprocessed_lines_file:    
-                        try:
-                            unprocessed_lines_file.write(line)
-                        except Exception as err:
-                            log.info(' %s' % err)
+            data_source, record_id = json_codec.record_keys(line)
+        except Exception:
+            data_source, record_id = None, None
+        entry = {"DATA_SOURCE": data_source, "RECORD_ID": record_id, "ERROR_CLASS": error_class, "ERROR": str(err), "ATTEMPTS": attempts,
+                 "FAILED_AT": datetime.now().isoformat(timespec = "seconds"), "LINE": line.rstrip("\n")}
+        data = (json_codec.dumps(entry) + "\n").encode("utf-8")
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.path, "ab", buffering = 0)
+            self.file.write(data)
+            self.count += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+# NDJSON stream of entities affected by loaded and redone records (withInfo responses of Senzing: DATA_SOURCE, RECORD_ID, AFFECTED_ENTITIES
+# and INTERESTING_ENTITIES), so downstream systems refresh only these entities instead of full snapshot. Entries are appended to file
+# ("-" for stdout) by single write each, as in DeadLetterSink, so processes of one load could share the file
+# write errors are logged and counted (failed, info_write_errors metric), never raised: record is already in Senzing then
+class InfoSink:
+
+    def __init__(self, path, log, metrics = None):
+        self.path = path
+        self.log = log
+        self.metrics = metrics
+        self.file = None
+        self.lock = threading.Lock()
+        self.count = 0
+        self.failed = 0
+
+    def write(self, info):
+        data = bytes(info).strip()
+        if not data: # e.g. redo queue was empty
+            return
+        try:
+            if b"\n" in data: # one line per entry
+                data = json_codec.dumps(json_codec.loads(data)).encode("utf-8")
+            with self.lock:
+                if self.file is None:
+                    self.file = open(sys.stdout.fileno(), "ab", buffering = 0, closefd = False) if self.path == '-' else open(self.path, "ab", buffering = 0)
+                self.file.write(data + b"\n")
+                self.count += 1
+        except Exception as err:
+            with self.lock:
+                self.failed += 1
+            if self.metrics:
+                self.metrics.inc("info_write_errors")
+            self.log.info(' Affected entities can not be written to %s: %s' % (self.path, err))
+            self.log.info(' ' + data.decode("utf-8", "replace"))
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+# default number of lines in work unit of loader thread and number of units queued ahead per thread
+LOAD_CHUNK_SIZE = 100
+LOAD_PREFETCH = 2
+# committed position is passed to progress at most every N seconds when it moves (besides every 1000 lines)
+PROGRESS_SECONDS = 1
 
+# load chunks of lines with G2Engine in threads: reader thread puts chunks into bounded queue (prefetch chunks per thread ahead),
+# each thread loads whole chunks, so there is no per line scheduling in main thread, returns number of processed lines
+# chunks are (position, lines) pairs, chunks are loaded out of order, so committed position is position of last chunk such that all chunks before it are loaded
+# records failed with retryable errors are tried again by RetryScheduler (chunk is committed when its retries are done), records failed for good
+# are written to dead_letters sink (or logged if there is no sink)
+# progress(lines, failed_lines, committed position) is called every 1000 lines, when committed position moves (at most every PROGRESS_SECONDS)
+# and at the end instead of logging (e.g. to save progress of load)
+# metrics (StageMetrics) get addRecord latencies, records/sec, records in flight, errors by class, retries and dead letters
+# with info_sink (InfoSink) records are added in withInfo mode, entities affected by them are written to sink
+def load_chunks(chunks, g2_engine, g2_configuration_manager, log, num_of_threads = 4, prefetch = LOAD_PREFETCH, progress = None, config_poll_seconds = CONFIG_POLL_SECONDS,
+                dead_letters = None, retry_attempts = RETRY_ATTEMPTS, metrics = None, info_sink = None):
+    config_watcher = ConfigWatcher(g2_engine, g2_configuration_manager, log, config_poll_seconds).start()
+    work_queue = queue.Queue(maxsize = num_of_threads * max(prefetch, 1))
+    retry_scheduler = RetryScheduler(work_queue).start()
+    condition = threading.Condition()
+    state = {"lines": 0, "failed": 0, "retried": 0, "error": None, "position": None, "next_chunk": 0, "chunks": None, "broken": False,
+             "reported": (None, 0)} # committed position passed to progress and its time
+    loaded_positions = {} # chunk number -> position, for chunks loaded before some previous chunk
+    pending_retries = {} # chunk number -> [position, number of records waiting for retry]
+    broken_chunks = set() # chunks with records not loaded because of loader thread error, committed position never passes them
+
+    def read_chunks():
+        chunk_number = 0
+        try:
+            for position, chunk in chunks:
+                work_queue.put((chunk_number, position, chunk, 0))
+                chunk_number += 1
+        except Exception as err:
+            state["error"] = err # raised in main thread when loaded lines are done
+        finally:
+            with condition:
+                state["chunks"] = chunk_number
+                condition.notify_all()
+
+    # record is done (loaded or failed for good), called with condition held
+    def count_lines(num_lines, failed):
+        previous_lines = state["lines"]
+        state["lines"] += num_lines
+        state["failed"] += failed
+        if metrics:
+            metrics.inc("records", num_lines - failed, status = "loaded")
+            metrics.inc("records", failed, status = "failed")
+            metrics.mark("records", num_lines)
+        if state["lines"] // 1000 > previous_lines // 1000:
+            if progress:
+                report_progress()
             else:
+                log.info(f'Processed {state["lines"]} loads')
+
+    # called with condition held
+    def report_progress():
+        state["reported"] = (state["position"], time.monotonic())
+        progress(state["lines"], state["failed"], state["position"])
+
+    # all records of chunk are done, called with condition held
+    def commit_chunk(chunk_number, position):
+        loaded_positions[chunk_number] = position
+        while state["next_chunk"] in loaded_positions:
+            position = loaded_positions.pop(state["next_chunk"])
+            if state["next_chunk"] in broken_chunks:
+                state["broken"] = True # resumed load must start before this chunk
+            if not state["broken"]:
+                state["position"] = position
+            state["next_chunk"] += 1
+        condition.notify_all()
+
+    def fail_line(line, err, error_class, attempts):
+        if dead_letters:
+            try:
+                dead_letters.write(line, error_class, err, attempts)
+            except Exception as write_err:
                 log.info(' Error, line recording failed ' + line)
-                log.info(' %s' % err)
-                if unprocessed_lines_file:
+                log.info(' Dead-letter file can not be written: %s' % write_err)
+        else:
+            log.info(' Error, line recording failed ' + line)
+        log.info(' %s error after %d attempts: %s' % (error_class, attempts, err))
+        if metrics:
+            metrics.inc("dead_letters")
+
+    # load_line measured for metrics
+    def load_measured_line(line):
+        if not metrics:
+            return load_line(line, g2_engine, config_watcher, info_sink)
+        metrics.inc("in_flight")
+        started = time.perf_counter()
+        try:
+            return load_line(line, g2_engine, config_watcher, info_sink)
+        finally:
+            metrics.observe("add_record_seconds", time.perf_counter() - started)
+            metrics.inc("in_flight", -1)
+
+    def load_work_items():
+        while (item := work_queue.get()) is not None:
+            chunk_number, position, chunk, attempt = item
+            failed = 0
+            retries = []
+            processed = 0 # records of chunk loaded, failed or waiting for retry
+            # chunk is counted and committed even if thread fails on it, so main thread doesn't wait for it forever
+            try:
+                for line in chunk:
                     try:
-                        unprocessed_lines_file.write(line)
-                    except Exception as err:
-                        log.info(' %s' % err)
-        
-        except Exception as err:
-            log.info(' %s' % err)
-                
-# process file with G2Engine
-def process_file(filename, senzing_init_config_json, log, num_of_threads = 4):
-    
-    log = logging.getLogger(log.name + '.process_file_function')
-    
-    # init G2Engine with config id
+                        err = load_measured_line(line)
+                    except Exception as unexpected_err:
+                        err = unexpected_err
+                    if err is not None:
+                        error_class = classify_error(err)
+                        if metrics:
+                            metrics.inc("errors", error_class = error_class)
+                        if error_class in RETRYABLE_ERROR_CLASSES and attempt + 1 < retry_attempts:
+                            retries.append(line)
+                        else:
+                            fail_line(line, err, error_class, attempt + 1)
+                            failed += 1
+                    processed += 1
+            except Exception as err:
+                log.info('Loader thread error, %d records of chunk are not loaded' % (len(chunk) - processed))
+                log.info(' %s' % err)
+                with condition:
+                    state["error"] = state["error"] or err # raised in main thread when loaded lines are done
+                    broken_chunks.add(chunk_number)
+            finally:
+                with condition:
+                    state["retried"] += len(retries)
+                    count_lines(len(chunk) - len(retries), failed + len(chunk) - processed)
+                    if attempt:
+                        pending = pending_retries[chunk_number]
+                        pending[1] -= len(chunk) - len(retries)
+                        if not pending[1]:
+                            del pending_retries[chunk_number]
+                            commit_chunk(chunk_number, pending[0])
+                    elif retries:
+                        pending_retries[chunk_number] = [position, len(retries)]
+                    else:
+                        commit_chunk(chunk_number, position)
+                    condition.notify_all()
+            if metrics and retries:
+                metrics.inc("retries", len(retries))
+            for line in retries:
+                retry_scheduler.schedule((chunk_number, None, [line], attempt + 1), attempt + 1)
+
+    threads = [threading.Thread(target = read_chunks, daemon = True)] + [threading.Thread(target = load_work_items, daemon = True) for _ in range(num_of_threads)]
+    for thread in threads:
+        thread.start()
+    # all chunks read and done (with their retries)
+    with condition:
+        while state["chunks"] is None or state["next_chunk"] < state["chunks"]:
+            condition.wait(PROGRESS_SECONDS)
+            # slow or small slices save their committed position too, not only every 1000 lines
+            reported_position, reported_at = state["reported"]
+            if progress and state["position"] != reported_position and time.monotonic() - reported_at >= PROGRESS_SECONDS:
+                report_progress()
+    retry_scheduler.stop()
+    for _ in range(num_of_threads):
+        work_queue.put(None)
+    for thread in threads:
+        thread.join()
+    config_watcher.stop()
+    if state["retried"]:
+        log.info('%d retries of failed records' % state["retried"])
+    if state["error"]:
+        raise state["error"]
+    if progress:
+        progress(state["lines"], state["failed"], state["position"])
+    return state["lines"]
+
+# load lines with G2Engine in threads by chunks of chunk_size lines, returns number of processed lines
+# load_options - keyword args of load_chunks (config_poll_seconds, dead_letters, retry_attempts, info_sink)
+def load_lines(lines, g2_engine, g2_configuration_manager, log, num_of_threads = 4, chunk_size = LOAD_CHUNK_SIZE, prefetch = LOAD_PREFETCH, progress = None, **load_options):
+    lines = iter(lines)
+    chunks = ((None, chunk) for chunk in iter(lambda: list(itertools.islice(lines, chunk_size)), []))
+    return load_chunks(chunks, g2_engine, g2_configuration_manager, log, num_of_threads, prefetch, progress, **load_options)
+
+# chunks of lines of file from position (offset in decompressed bytes, line number), yields (position after chunk, lines)
+# with slices > 1 only lines of slice_index-th part of file are read: byte range of plain file (lines starting in range), every slices-th line of compressed file
+def read_position_chunks(filename, chunk_size = LOAD_CHUNK_SIZE, position = (0, 0), slice_index = 0, slices = 1):
+    offset, line_number = position
+    end = None
+    striped = slices > 1 and compressed_io.is_compressed(filename)
+    with compressed_io.open_binary(filename) as fh:
+        if slices > 1 and not striped:
+            size = os.path.getsize(filename)
+            start, end = size * slice_index // slices, size * (slice_index + 1) // slices
+            if offset == 0 and start > 0:
+                fh.seek(start - 1)
+                fh.readline() # line started in previous slice
+                offset = fh.tell()
+        compressed_io.skip_to(fh, offset)
+        chunk = []
+        for line in fh:
+            if end is not None and offset >= end:
+                break
+            offset += len(line)
+            line_number += 1
+            if striped and (line_number - 1) % slices != slice_index:
+                continue
+            chunk.append(line.decode("utf-8"))
+            if len(chunk) == chunk_size:
+                yield (offset, line_number), chunk
+                chunk = []
+    if chunk:
+        yield (offset, line_number), chunk
+
+# init G2Engine and return it
+def init_engine(senzing_init_config_json, log):
+
+    log = logging.getLogger(log.name + ".init_engine_function")
+
     g2_engine = G2Engine()
-    
-    # init G2ConfigMgr
-    g2_configuration_manager = init_configuration_manager(senzing_init_config_json, log)
-    
     try:
         g2_engine.init(
             module_name,
@@ -424,31 +866,61 @@ def process_file(filename, senzing_init_config_json, log, num_of_threads = 4):
         log.info('G2Engine initalization failed')
         log.info(' %s' % err)
         sys.exit(1)
+    return g2_engine
+
+# metrics of loader exported by MetricsExporter, metrics_exports - its keyword args (json_file, prometheus_file, port),
+# each process of multi-process load exports its own metrics: files with slice suffix (as shards of mapper), port + slice index
+def start_load_metrics(filename, metrics_exports, slice_index = 0, slices = 1):
+    labels = {"file": os.path.basename(filename)}
+    if slices > 1:
+        labels["slice"] = '%d/%d' % (slice_index + 1, slices)
+        metrics_exports = dict(metrics_exports)
+        for key in ("json_file", "prometheus_file"):
+            if metrics_exports.get(key):
+                name, extension = os.path.splitext(metrics_exports[key])
+                metrics_exports[key] = '%s_%03d_of_%03d%s' % (name, slice_index + 1, slices, extension)
+        if metrics_exports.get("port"):
+            metrics_exports["port"] += slice_index
+    return MetricsExporter(StageMetrics("senzing_loader", **labels), **metrics_exports).start()
+
+# process file (or its slice) with G2Engine, records failed for good are appended to dead_letter_file
+# with info_file records are added in withInfo mode and entities affected by them are appended to info_file (see InfoSink)
+# load_options - keyword args of load_chunks (config_poll_seconds, retry_attempts), metrics_exports - see start_load_metrics
+def process_file(filename, senzing_init_config_json, log, num_of_threads = 4, chunk_size = LOAD_CHUNK_SIZE, prefetch = LOAD_PREFETCH,
+                 slice_index = 0, slices = 1, progress = None, position = (0, 0), dead_letter_file = None, metrics_exports = None, info_file = None, **load_options):
+    
+    log = logging.getLogger(log.name + '.process_file_function')
+    
+    # init G2Engine with config id
+    g2_engine = init_engine(senzing_init_config_json, log)
+    
+    # init G2ConfigMgr
+    g2_configuration_manager = init_configuration_manager(senzing_init_config_json, log)
         
     # add records - seems to be right
+    dead_letters = DeadLetterSink(dead_letter_file) if dead_letter_file else None
+    metrics_exporter = start_load_metrics(filename, metrics_exports, slice_index, slices) if metrics_exports else None
+    info_sink = InfoSink(info_file, log, metrics_exporter.metrics if metrics_exporter else None) if info_file else None
     try:
-        with open(filename, "r") as fp:
-            numLines = 0
-        
-            with concurrent.futures.ThreadPoolExecutor(num_of_threads) as executor:
-                futures = {executor.submit(load_line, line, g2_engine, g2_configuration_manager, log): line for line in itertools.islice(fp, executor._max_workers)}
-            
-                while futures:
-                    done, futures = concurrent.futures.wait(futures, return_when = concurrent.futures.FIRST_COMPLETED)
-            
-                    for fut in done:                
-                        numLines += 1
-                        if numLines % 1000 == 0:
-                            log.info(f'Processed {numLines} loads')
-            
-                    for line in itertools.islice(fp, len(done)):
-                        futures.add(executor.submit(load_line, line, g2_engine, g2_configuration_manager, log))
+        load_chunks(read_position_chunks(filename, chunk_size, position, slice_index, slices), g2_engine, g2_configuration_manager, log, num_of_threads, prefetch, progress,
+                    dead_letters = dead_letters, metrics = metrics_exporter.metrics if metrics_exporter else None, info_sink = info_sink, **load_options)
         log.info('Load records process success')
 
     except Exception as err:
         log.info('Records not loaded')
         log.info(' %s' % err)
         sys.exit(1)
+    finally:
+        if dead_letters:
+            dead_letters.close()
+        if info_sink:
+            info_sink.close()
+        if metrics_exporter:
+            metrics_exporter.stop() # final summary
+    if dead_letters and dead_letters.count:
+        log.info('%d failed records written to %s' % (dead_letters.count, dead_letter_file))
+    if info_sink:
+        log.info('Affected entities of %d records written to %s' % (info_sink.count, info_file) + (' (%d not written, see log above)' % info_sink.failed if info_sink.failed else ''))
     
     # destroy G2Engine
     try:
@@ -457,8 +929,58 @@ def process_file(filename, senzing_init_config_json, log, num_of_threads = 4):
     except G2Exception as err:
         log.info(g2_engine.getLastException)
 
+# save progress of slice and log totals of load
+def report_progress(load_progress, log, slice_index, lines, failed, position):
+    if not load_progress.update(slice_index, lines, failed, position):
+        log.info('Load progress can not be saved to ' + load_progress.path + ', load could not be resumed')
+    log.info('Processed %d loads (%d failed)' % (sum(load_progress.lines), sum(load_progress.failed)))
+
+# load slice of file in child process with its own G2Engine, progress (lines, failed lines, committed position) is sent to parent through progress_queue
+def load_file_slice(source_file, senzing_init_settings_filename, log, slice_index, slices, num_of_threads, chunk_size, prefetch, progress_queue, position = (0, 0),
+                    dead_letter_file = None, metrics_exports = None, load_options = None):
+
+    log = logging.getLogger(log.name + '.load_file_slice_function')
+
+    senzing_init_config_json = init_senzing(senzing_init_settings_filename, log)
+    process_file(source_file, senzing_init_config_json, log, num_of_threads, chunk_size, prefetch, slice_index, slices,
+                 progress = lambda lines, failed, position: progress_queue.put((slice_index, lines, failed, position)), position = position,
+                 dead_letter_file = dead_letter_file, metrics_exports = metrics_exports, **(load_options or {}))
+
+# load file in processes (each with its own G2Engine and threads) by slices, progress and failures are aggregated here
+def load_file_in_processes(source_file, senzing_init_settings_filename, log, processes, load_progress, num_of_threads = 4, chunk_size = LOAD_CHUNK_SIZE, prefetch = LOAD_PREFETCH,
+                           dead_letter_file = None, metrics_exports = None, **load_options):
+
+    log = logging.getLogger(log.name + '.load_file_in_processes_function')
+
+    log.info('Loading file in %d processes' % processes)
+    # senzing is initialized in children only, fork is used so they inherit logging setup
+    mp_context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else multiprocessing.get_context()
+    progress_queue = mp_context.Queue()
+    workers = [mp_context.Process(target = load_file_slice, args = (source_file, senzing_init_settings_filename, log, slice_index, processes,
+                                                                    num_of_threads, chunk_size, prefetch, progress_queue, load_progress.positions[slice_index],
+                                                                    dead_letter_file, metrics_exports, load_options))
+               for slice_index in range(processes)]
+    for worker in workers:
+        worker.start()
+    while any(worker.is_alive() for worker in workers) or not progress_queue.empty():
+        try:
+            message = progress_queue.get(timeout = 1)
+        except queue.Empty:
+            continue
+        report_progress(load_progress, log, *message)
+    for worker in workers:
+        worker.join()
+    failed_slices = [slice_index for slice_index, worker in enumerate(workers) if worker.exitcode != 0]
+    log.info('Processed %d loads (%d failed) in %d processes' % (sum(load_progress.lines), sum(load_progress.failed), processes))
+    if failed_slices:
+        raise RuntimeError('loading of slices %s failed, see log above' % ', '.join('%d/%d' % (slice_index + 1, processes) for slice_index in failed_slices))
+
 # load records from senzing JSON file
-def load_records_to_senzing(source_file, senzing_init_settings_filename, log = None, num_of_threads = 4):
+# committed position of load is saved to progress_file (<source file>.progress by default), with resume load starts from saved position
+# records failed for good are appended to dead_letter_file (<source file>.dead_letter.json by default)
+# load_options - keyword args of process_file (info_file) and load_chunks (config_poll_seconds, retry_attempts), metrics_exports - see start_load_metrics
+def load_records_to_senzing(source_file, senzing_init_settings_filename, log = None, num_of_threads = 4, chunk_size = LOAD_CHUNK_SIZE, prefetch = LOAD_PREFETCH, processes = 1,
+                            resume = False, progress_file = None, dead_letter_file = None, metrics_exports = None, **load_options):
        
     if not log: # init logging if no logger provided
         logging.basicConfig(level = logging.DEBUG)
@@ -470,11 +992,25 @@ def load_records_to_senzing(source_file, senzing_init_settings_filename, log = N
 
     try:
         
-        # init senzing
-        senzing_init_config_json = init_senzing(senzing_init_settings_filename, log)
+        load_progress = LoadProgress(progress_file or source_file + '.progress', source_file, processes)
+        if resume:
+            if load_progress.resume():
+                log.info('Resuming load from offsets: ' + ', '.join(str(offset) for offset, _ in load_progress.positions))
+            else:
+                log.info('No progress of previous load of this file found, loading from the start')
+        dead_letter_file = dead_letter_file or source_file + '.dead_letter.json'
+        if processes > 1:
+            load_file_in_processes(source_file, senzing_init_settings_filename, log, processes, load_progress, num_of_threads, chunk_size, prefetch, dead_letter_file,
+                                   metrics_exports, **load_options)
+        else:
+            # init senzing
+            senzing_init_config_json = init_senzing(senzing_init_settings_filename, log)
     
-        # process entities with G2Engine
-        process_file(source_file, senzing_init_config_json, log, num_of_threads)
+            # process entities with G2Engine
+            process_file(source_file, senzing_init_config_json, log, num_of_threads, chunk_size, prefetch,
+                         progress = functools.partial(report_progress, load_progress, log, 0), position = load_progress.positions[0],
+                         dead_letter_file = dead_letter_file, metrics_exports = metrics_exports, **load_options)
+        load_progress.remove()
 
         log.info('File loaded!')
 
@@ -482,26 +1018,70 @@ def load_records_to_senzing(source_file, senzing_init_settings_filename, log = N
         log.info(' %s' % err)
         sys.exit(1)
 
-# redo 1 record function
-def redo_record(response_bytearray, engine, config_engine, log):
+# load records of dead-letter file again (e.g. after config fix or DB failover), records failed again are appended to failed_file
+# (<dead-letter file>.failed by default), with info_file entities affected by replayed records are appended to it (see InfoSink)
+# load_options - keyword args of load_chunks (config_poll_seconds, retry_attempts)
+def replay_dead_letters(dead_letter_file, senzing_init_settings_filename, log = None, num_of_threads = 4, failed_file = None, info_file = None, **load_options):
+
+    if not log: # init logging if no logger provided
+        logging.basicConfig(level = logging.DEBUG)
+        log = logging.getLogger("replay_dead_letters_function")
+    else:
+        log = logging.getLogger(log.name + '.replay_dead_letters_function')
+
+    log.info('Replaying records from dead-letter file: ' + dead_letter_file)
+
+    try:
+        senzing_init_config_json = init_senzing(senzing_init_settings_filename, log)
+        g2_engine = init_engine(senzing_init_config_json, log)
+        g2_configuration_manager = init_configuration_manager(senzing_init_config_json, log)
+        failed_file = failed_file or dead_letter_file + '.failed'
+        dead_letters = DeadLetterSink(failed_file)
+        info_sink = InfoSink(info_file, log) if info_file else None
+        try:
+            with compressed_io.open_text(dead_letter_file, "r") as fh:
+                lines = (json_codec.loads(entry)["LINE"] + "\n" for entry in fh if entry.strip())
+                replayed = load_lines(lines, g2_engine, g2_configuration_manager, log, num_of_threads, dead_letters = dead_letters, info_sink = info_sink, **load_options)
+        finally:
+            dead_letters.close()
+            if info_sink:
+                info_sink.close()
+        log.info('%d records replayed, %d failed again' % (replayed, dead_letters.count) + (' (written to %s)' % failed_file if dead_letters.count else ''))
+        g2_engine.destroy()
+
+    except Exception as err:
+        log.info(' %s' % err)
+        sys.exit(1)
+
+# redo 1 record function, metrics (StageMetrics) get processRedoRecord latencies and errors by class
+# with info_sink (InfoSink) record is redone with processRedoRecordWithInfo and entities affected by it are written to sink
+def redo_record(response_bytearray, engine, config_watcher, log, metrics = None, info_sink = None):
     
     log = logging.getLogger(log.name + '.redo_record_function')
     
+    started = time.perf_counter()
     try:
-        engine.processRedoRecord(response_bytearray)
-    except G2Exception as err:
-        active_config_id_bytearray = bytearray()
-        default_config_id_bytearray = bytearray()
-        engine.getActiveConfigID(active_config_id_bytearray)
-        config_engine.getDefaultConfigID(default_config_id_bytearray)
-        if  active_config_id_bytearray != default_config_id_bytearray:    
-            engine.reinit(default_config_id_bytearray)
-            log.info('G2Engine reinitialised')
+        if info_sink is None:
+            with config_watcher.engine_call():
+                engine.processRedoRecord(response_bytearray)
         else:
-            log.info(' %s' % err)
+            info_bytearray = bytearray()
+            with config_watcher.engine_call():
+                engine.processRedoRecordWithInfo(response_bytearray, info_bytearray)
+            info_sink.write(info_bytearray)
+    except G2Exception as err:
+        config_watcher.request_poll()
+        log.info(' %s' % err)
+        if metrics:
+            metrics.inc("errors", error_class = classify_error(err))
+    finally:
+        if metrics:
+            metrics.observe("process_redo_seconds", time.perf_counter() - started)
 
 # redo records process
-def process_redo_records(senzing_init_settings_filename, log = None, num_of_threads = 4):
+# metrics_exports - keyword args of MetricsExporter (json_file, prometheus_file, port) for redo latencies, redos/sec, redos in flight, errors and redo backlog
+# with info_file records are redone in withInfo mode and entities affected by them are appended to info_file (see InfoSink)
+def process_redo_records(senzing_init_settings_filename, log = None, num_of_threads = 4, config_poll_seconds = CONFIG_POLL_SECONDS, metrics_exports = None, info_file = None):
     
     if not log: # init logging if no logger provided
         logging.basicConfig(level = logging.DEBUG)
@@ -529,11 +1109,15 @@ def process_redo_records(senzing_init_settings_filename, log = None, num_of_thre
         log.info(' %s' % err)
         sys.exit(1)
     log.info('There are ' + str(g2_engine.countRedoRecords()) + ' records for redoing for now' )
+    config_watcher = ConfigWatcher(g2_engine, g2_configuration_manager, log, config_poll_seconds).start()
+    metrics_exporter = MetricsExporter(StageMetrics("senzing_redo"), **metrics_exports).start() if metrics_exports else None
+    metrics = metrics_exporter.metrics if metrics_exporter else None
+    info_sink = InfoSink(info_file, log, metrics) if info_file else None
     # redo records - infinite loop
     numLines = 0
     try:
         with concurrent.futures.ThreadPoolExecutor(num_of_threads) as executor:
-            futures = {executor.submit(redo_record, response_bytearray, g2_engine, g2_configuration_manager, log): response_bytearray for response_bytearray in [bytearray()] * executor._max_workers} # dont sure, especially about "[bytearray()] * executor._max_workers" part
+            futures = {executor.submit(redo_record, response_bytearray, g2_engine, config_watcher, log, metrics, info_sink): response_bytearray for response_bytearray in [bytearray()] * executor._max_workers} # dont sure, especially about "[bytearray()] * executor._max_workers" part
             while True:
                 done, futures = concurrent.futures.wait(futures, return_when = concurrent.futures.FIRST_COMPLETED)
                 
@@ -541,14 +1125,24 @@ def process_redo_records(senzing_init_settings_filename, log = None, num_of_thre
                     numLines += 1
                     if numLines%1000 == 0:
                         log.info(f'Processed {numLines} redos')
-                if g2_engine.countRedoRecords():               
+                redo_backlog = g2_engine.countRedoRecords()
+                if redo_backlog:
                     for i in range(0, len(done)):
-                        futures.add(executor.submit(redo_record, bytearray(), g2_engine, g2_configuration_manager, log))
-                else:
-                    if len(futures) == 0:
-                        time.sleep(10) # if no new and all done
+                        futures.add(executor.submit(redo_record, bytearray(), g2_engine, config_watcher, log, metrics, info_sink))
+                if metrics:
+                    metrics.inc("redos", len(done))
+                    metrics.mark("redos", len(done))
+                    metrics.set("redo_backlog", redo_backlog)
+                    metrics.set("in_flight", len(futures))
+                if not redo_backlog and len(futures) == 0:
+                    time.sleep(10) # if no new and all done
         
     except Exception as err:
         log.info('Redo process init failed')
         log.info(' %s' % err)
+    finally:
+        if info_sink:
+            info_sink.close()
+        if metrics_exporter:
+            metrics_exporter.stop() # final summary
 
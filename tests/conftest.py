@@ -0,0 +1,5 @@
+import os
+import sys
+
+# scripts are in repo root (not a package), tests import them as modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
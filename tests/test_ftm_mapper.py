@@ -0,0 +1,28 @@
+import logging
+from ftm_mapper import process_entities, relationship_fragment, IntervalRecord
+from benchmark import generate_corpus
+
+log = logging.getLogger("test_ftm_mapper")
+
+def map_corpus(tmp_path, name, index_file = None):
+    corpus_file = str(tmp_path / "corpus.json")
+    if not (tmp_path / "corpus.json").exists():
+        generate_corpus(corpus_file, log, entities = 500, hubs = 1, hub_size = 50)
+    output_file = str(tmp_path / (name + ".json"))
+    stats = {}
+    process_entities("TEST", corpus_file, log = log, index_file = index_file, output_file = output_file, stats = stats)
+    with open(output_file, "rb") as fh:
+        return fh.read(), stats["metrics"]["counters"]
+
+def test_relationship_anchors_same_for_both_index_types(tmp_path):
+    in_memory, in_memory_counters = map_corpus(tmp_path, "in_memory")
+    on_disk, on_disk_counters = map_corpus(tmp_path, "on_disk", index_file = str(tmp_path / "index.sqlite"))
+    assert in_memory == on_disk
+    assert in_memory_counters["relationship_anchors"] == on_disk_counters["relationship_anchors"] > 0
+
+def test_relationship_fragment_keeps_repeated_pointers():
+    # the same subject and role from two intervals gives two pointers, as transform wrote them before fragments were prebuilt
+    records = [IntervalRecord(("director",), ("p1",)), IntervalRecord(("director",), ("p1", "p2"))]
+    fragment = relationship_fragment("TEST", "c1", records, {})
+    assert fragment[0] == {"REL_ANCHOR_DOMAIN": "TEST", "REL_ANCHOR_KEY": "c1"}
+    assert [(pointer["REL_POINTER_KEY"], pointer["REL_POINTER_ROLE"]) for pointer in fragment[1:]] == [("p1", "director"), ("p1", "director"), ("p2", "director")]
@@ -0,0 +1,25 @@
+import json
+import importlib
+import pytest
+import json_codec
+
+RECORD = {"DATA_SOURCE": "TEST", "RECORD_ID": "person-1", "NAME_LIST": [{"NAME_TYPE": "PRIMARY", "NAME_FULL": "Жérôme \U0001F600 \"Q\""}],
+          "ADDR_LINE2": None, "DATE": "2020-01-01", "COUNT": 3, "SHARE": 0.25, "ACTIVE": True}
+
+@pytest.fixture(params = ["orjson", "simdjson", "json"])
+def codec(request, monkeypatch):
+    monkeypatch.setenv("JSON_CODEC", request.param)
+    yield importlib.reload(json_codec)
+    monkeypatch.delenv("JSON_CODEC")
+    importlib.reload(json_codec)
+
+# mapper output is the same as json.dumps wrote it before codec, whatever backend is installed
+def test_dumps_record_writes_json_dumps_format(codec):
+    assert codec.dumps_record(RECORD).encode() == json.dumps(RECORD).encode()
+
+def test_dumps_is_the_same_for_all_backends(codec):
+    assert codec.dumps(RECORD).encode() == json.dumps(RECORD, ensure_ascii = False, separators = (',', ':')).encode()
+
+def test_record_keys_from_output_line(codec):
+    assert codec.record_keys(codec.dumps_record(RECORD)) == ("TEST", "person-1")
+    assert codec.record_keys(codec.dumps_record({"DATA_SOURCE": "TEST", "RECORD_ID": "é"})) == ("TEST", "é")
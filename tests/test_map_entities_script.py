@@ -0,0 +1,26 @@
+import os
+import logging
+import multiprocessing
+import pytest
+import map_entities_script
+
+log = logging.getLogger("test_map_entities_script")
+
+# stands in for process_entities in pool workers, worker of "bad" file dies as if killed by OOM killer
+def fake_process_entities(data_source, source_file, log, output_file = None, stats = None, **options):
+    if "bad" in source_file:
+        os._exit(1)
+    with open(output_file, "w") as fh:
+        fh.write("{}\n")
+    stats.update(records_written = 1, output_files = [output_file])
+
+# patched function is only seen by workers forked from test process
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork", reason = "needs fork start method")
+def test_broken_pool_fails_only_file_which_killed_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(map_entities_script, "process_entities", fake_process_entities)
+    names = ["a.json", "bad.json", "b.json", "c.json"]
+    tasks = [(str(tmp_path / name), "TEST", 100) for name in names]
+    summaries = map_entities_script.map_files_in_pool(tasks, str(tmp_path) + os.sep, log, None, 1, 2, None)
+    result = {os.path.basename(summary["file"]): summary["ok"] for summary in summaries}
+    assert result == {"a.json": True, "bad.json": False, "b.json": True, "c.json": True}
+    assert "worker process died" in next(summary["error"] for summary in summaries if not summary["ok"])
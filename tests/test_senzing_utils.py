@@ -0,0 +1,46 @@
+from senzing_utils import load_line
+
+# config watcher which reinitialises engine during every call (generation moves on each read)
+class ReinitialisingConfigWatcher:
+
+    def __init__(self):
+        self.reads = 0
+        self.polls = 0
+
+    @property
+    def generation(self):
+        self.reads += 1
+        return self.reads
+
+    def request_poll(self):
+        self.polls += 1
+
+    def engine_call(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+class FailingEngine:
+
+    def __init__(self):
+        self.calls = 0
+
+    def addRecord(self, dataSourceCode, recordId, jsonData):
+        self.calls += 1
+        raise RuntimeError('engine error')
+
+def test_line_without_keys_returns_its_error_without_retry():
+    engine = FailingEngine()
+    err = load_line('not json', engine, ReinitialisingConfigWatcher())
+    assert not isinstance(err, UnboundLocalError)
+    assert engine.calls == 0
+
+def test_record_is_tried_again_after_reinit():
+    engine = FailingEngine()
+    err = load_line('{"DATA_SOURCE": "TEST", "RECORD_ID": "1"}', engine, ReinitialisingConfigWatcher())
+    assert str(err) == 'engine error'
+    assert engine.calls == 2